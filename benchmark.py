@@ -0,0 +1,5 @@
+#!/usr/bin/env python
+import tragos.benchmark
+
+if __name__ == '__main__':
+    tragos.benchmark.main()
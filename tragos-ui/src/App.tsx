@@ -12,6 +12,7 @@ import { SidePanel } from './SidePanel';
 import { StatsView } from './StatsView';
 import { useFetch } from './FetchReducer';
 import { Event, Venue, Group, Seat } from './Models';
+import { expandEvent, expandVenue } from './Encoding';
 import { ToolBar } from './ToolBar';
 import { VenueMap } from './VenueMap';
 import { FormAddGroup, FormEditGroup } from './GroupForms';
@@ -48,10 +49,10 @@ function EventPage(props: EventPageProps) {
   const { id, group_n, setTitle } = props;
   let match = useRouteMatch();
 
-  const eventFetcher = useFetch<Event>(`/events/${id}`)
+  const eventFetcher = useFetch<Event>(`/events/${id}?format=compact`, undefined, expandEvent)
   const event = eventFetcher.state.data;
 
-  const venueFetcher = useFetch<Venue>(null);
+  const venueFetcher = useFetch<Venue>(null, undefined, expandVenue);
   const venue = venueFetcher.state.data;
 
   const [selectedSeat, setSelectedSeat] = useState<Seat | null>(null)
@@ -71,13 +72,13 @@ function EventPage(props: EventPageProps) {
   const [groupOfSelectedSeat, setGroupOfSelectedSeat] = useState<Group | null>(null);
 
   useEffect(() => {
-    eventFetcher.setUrl(`/events/${id}`)
+    eventFetcher.setUrl(`/events/${id}?format=compact`)
   }, [id])
 
 
   useEffect(() => {
     if (event) {
-      venueFetcher.setUrl(`/venues/${event.venue_id}`)
+      venueFetcher.setUrl(`/venues/${event.venue_id}?format=compact`)
     }
     else {
       venueFetcher.setUrl(null)
@@ -0,0 +1,64 @@
+import { Event, Venue, Seat, Row, Solution, SeatSolution, SeatStatus } from './Models';
+
+// compact encoding served by the api with ?format=compact, see tragos/encoding.py
+
+export interface CompactGrid {
+    // one char per seat: '.' empty, 'o' occupied, 'x' blocked
+    status: string[]
+    // per row, for its occupied seats only
+    slot_n: (number|null)[][]
+    group_n: (number|null)[][]
+}
+
+export interface CompactRow {
+    name: string
+    row_n: number
+    seats: { [K in keyof Seat]: Seat[K][] }
+}
+
+const CHAR_STATUSES: { [char: string]: SeatStatus } = {
+    '.': SeatStatus.EMPTY,
+    'o': SeatStatus.OCCUPIED,
+    'x': SeatStatus.BLOCKED,
+}
+
+export function expandGrid(grid: CompactGrid): SeatSolution[][] {
+    return grid.status.map((status, row_n) => {
+        let i = 0
+        return Array.from(status, char => {
+            const seatStatus = CHAR_STATUSES[char]
+            if (seatStatus !== SeatStatus.OCCUPIED) {
+                return { status: seatStatus, slot_n: null, group_n: null }
+            }
+            const seatSolution = { status: seatStatus, slot_n: grid.slot_n[row_n][i], group_n: grid.group_n[row_n][i] }
+            i++
+            return seatSolution
+        })
+    })
+}
+
+export function expandRow(row: CompactRow): Row {
+    const seats: Seat[] = row.seats.seat_n.map((_, i) => ({
+        row_name: row.seats.row_name[i],
+        col_name: row.seats.col_name[i],
+        x: row.seats.x[i],
+        y: row.seats.y[i],
+        row_n: row.seats.row_n[i],
+        seat_n: row.seats.seat_n[i],
+        accessible: row.seats.accessible[i],
+        value: row.seats.value[i],
+    }))
+    return { name: row.name, row_n: row.row_n, seats }
+}
+
+export function expandEvent(event: any): Event {
+    if (!event.solution) {
+        return event
+    }
+    const solution: Solution = { ...event.solution, grid: expandGrid(event.solution.grid) }
+    return { ...event, solution }
+}
+
+export function expandVenue(venue: any): Venue {
+    return { ...venue, rows: venue.rows.map(expandRow) }
+}
@@ -42,7 +42,8 @@ export interface Fetcher<T> {
 }
 
 
-export function useFetch<T>(initialUrl: string|null, initialData?: T): Fetcher<T> {
+// transform converts the response body, e.g. to expand a compact encoding
+export function useFetch<T>(initialUrl: string|null, initialData?: T, transform?: (data: any) => T): Fetcher<T> {
 
     const [url, setUrl] = useState<string|null>(initialUrl)
 
@@ -67,7 +68,7 @@ export function useFetch<T>(initialUrl: string|null, initialData?: T): Fetcher<T
                 const result = await axios(url);
 
                 if (!didCancel) {
-                    dispatch({ type: 'FETCH_SUCCESS', payload: result.data as T });
+                    dispatch({ type: 'FETCH_SUCCESS', payload: transform ? transform(result.data) : result.data as T });
                 }
             } catch (error) {
                 if (!didCancel) {
@@ -72,6 +72,7 @@ export interface SeatSolution {
 
 export interface Solution {
     success: boolean
+    truncated: boolean
 
     num_groups_placed: number
     num_groups_declined: number
@@ -95,6 +96,42 @@ export interface Event {
     name: string
     requirements: Requirements
     solution: Solution
+    version: number
+    requirements_version: number
+}
+
+export interface EventSummary {
+    _id: string
+    show_date: string
+    venue_id: string
+    name: string
+}
+
+export interface EventRequirements {
+    _id: string
+    requirements: Requirements
+    version: number
+}
+
+export interface ComputeProgress {
+    num_groups_total: number
+    num_groups_placed: number
+    num_groups_declined: number
+    num_iterations: number
+    elapsed: number
+}
+
+export type JobStatus = "PENDING" | "RUNNING" | "DONE" | "FAILED"
+
+export interface Job {
+    _id: string
+    event_id: string
+    status: JobStatus
+    created_at: string
+    progress: ComputeProgress
+    // where the search time went, set when the job is done
+    stats: { [name: string]: number } | null
+    error: string | null
 }
 
 export interface ApiError {
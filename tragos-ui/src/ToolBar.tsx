@@ -2,9 +2,13 @@ import React, { useCallback, useState, useEffect, ReactElement } from 'react';
 import { Button, Classes, Icon, Divider, ButtonGroup, Switch as BpSwitch, RadioGroup, Radio, Popover, ControlGroup, Alert } from "@blueprintjs/core";
 import { Link, useRouteMatch } from 'react-router-dom';
 import Axios from 'axios';
-import { Event, ApiError } from './Models'
+import { Event, ApiError, Job } from './Models'
 import { removeTrailingSlash } from './utils';
 
+// a job is polled every JOB_POLL_INTERVAL ms, for 10 minutes at most
+const JOB_POLL_INTERVAL = 500
+const MAX_JOB_POLLS = 1200
+
 interface ToolbarProps {
     refreshEvent: () => any
     event: Event
@@ -38,8 +42,27 @@ export function ToolBar(props: ToolbarProps) {
 
     const recompute = useCallback(async () => {
         setComputing(true)
-        await Axios.post(`/events/${props.event._id}/compute`)
-        setComputing(false)
+        try {
+            let { data: job } = await Axios.post<Job>(`/events/${props.event._id}/compute`)
+            let polls = 0
+            while ((job.status === "PENDING" || job.status === "RUNNING") && polls < MAX_JOB_POLLS) {
+                await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL))
+                job = (await Axios.get<Job>(`/jobs/${job._id}`)).data
+                polls++
+            }
+            if (job.status === "PENDING" || job.status === "RUNNING") {
+                setError(AlertError({ message: "Le calcul ne répond plus", close: () => setError(null) }))
+            }
+            else if (job.status === "FAILED") {
+                setError(AlertError({ message: job.error || "Le calcul a échoué", close: () => setError(null) }))
+            }
+        }
+        catch (exc) {
+            setError(AlertError({ message: exc.response?.data?.error?.message || exc.message, close: () => setError(null) }))
+        }
+        finally {
+            setComputing(false)
+        }
         props.refreshEvent()
     }, [props.event, props.refreshEvent])
 
@@ -2,7 +2,7 @@ import React from 'react';
 import { Navbar, NavbarGroup, NavbarDivider, Icon, MenuItem, Button } from "@blueprintjs/core";
 import { Select } from "@blueprintjs/select";
 import { Link, useHistory } from 'react-router-dom';
-import {Event} from './Models';
+import {Event, EventSummary} from './Models';
 import { useFetch } from './FetchReducer';
 
 
@@ -11,7 +11,7 @@ interface TopBarProps {
     currentEvent?: Event
 }
 
-type EventList = Event[];
+type EventList = EventSummary[];
 
 export function TopBar(props : TopBarProps) {
 
@@ -0,0 +1,50 @@
+from math import pi
+
+import numpy as np
+
+from tragos.models import Venue
+
+
+def normalize(values: np.ndarray) -> np.ndarray:
+    """
+    Scale values to [0, 1], all values are 0 if they are all equal
+    """
+    value_range = values.max() - values.min()
+    if value_range == 0:
+        return np.zeros_like(values)
+    return (values - values.min()) / value_range
+
+
+def compute_seats_value(venue: Venue):
+    """
+    Set the value of every seat of the venue, from its distance and its angle to the center of the stage: the closer
+    and the more in front of the stage, the better.
+    """
+    seats = [seat for row in venue.rows for seat in row.seats]
+    if len(seats) == 0:
+        return
+    x = np.array([seat.x for seat in seats], dtype=np.float64)
+    y = np.array([seat.y for seat in seats], dtype=np.float64)
+
+    dx = np.abs(x - venue.stage_center_x)
+    dy = np.abs(y - venue.stage_center_y)
+    distance = np.sqrt(dx ** 2 + dy ** 2)
+    # seats level with the stage center have a right angle, or none if they are on it
+    level = dy == 0
+    angle = np.where(level, np.where(dx > 0, pi / 2, 0), np.arctan(dx / np.where(level, 1, dy)))
+
+    values = ((1 - normalize(distance)) + (1 - normalize(angle))) / 2
+    for seat, value in zip(seats, values.tolist()):
+        seat.value = value
+
+
+def analyze_venue(venue: Venue, force=False) -> Venue:
+    """
+    Venue analysis stage, to run when a venue is created or its seats change: compute the seat values, unless they
+    are all known already and force is not set.
+    The values of the slots, sums of their seat values, are precomputed along with the other per-venue tables in the
+    engine MetaState, which is cached per venue.
+    """
+    if force or any(seat.value is None for row in venue.rows for seat in row.seats):
+        compute_seats_value(venue)
+    return venue
@@ -1,20 +1,33 @@
+import csv
+import hashlib
+import io
+import itertools
+import json
+import logging
 import traceback
+from dataclasses import asdict, astuple, fields
+from typing import Callable, Dict, Hashable, Tuple, Optional, List, Iterator
 
 import dateutil.parser
 import flask
 from bson import ObjectId
 from flask import Flask, jsonify, request
-from schema import Schema, And, Use, SchemaError
+from schema import Schema, And, Use, SchemaError, Optional as SchemaOptional
 
-from tragos import Config
+from tragos import Config, encoding
+from tragos.cache import LRUCache
 from tragos.database import DatabaseManager
-from tragos.models import Group
-from tragos.services import TragosException, MainService, NotFoundException
+from tragos.jobs import JobRunner
+from tragos.models import Group, SeatAssignment
+from tragos.services import TragosException, MainService, NotFoundException, ConflictException
 
+logging.basicConfig(level=Config.LOG_LEVEL)
 app = Flask('tragos')
+# the client connects lazily, indexes are created at deploy time by python -m tragos.database
 db = DatabaseManager.from_config()
 
 service = MainService(db)
+job_runner = JobRunner(service, max_workers=Config.COMPUTE_WORKERS)
 
 
 class JSONEncoder(flask.json.JSONEncoder):
@@ -26,6 +39,54 @@ class JSONEncoder(flask.json.JSONEncoder):
 
 app.json_encoder = JSONEncoder
 
+# clients ask for the compact encoding of grids and venue rows with this Accept header or with ?format=compact
+COMPACT_MIMETYPE = 'application/vnd.tragos.compact+json'
+
+
+def compact_requested() -> bool:
+    if request.args.get('format') == 'compact':
+        return True
+    return request.accept_mimetypes[COMPACT_MIMETYPE] > request.accept_mimetypes['application/json']
+
+
+def jsonify_negotiated(obj, compact: Callable[[Dict], Dict]):
+    """
+    Serialize a dataclass, applying compact to its document if the client asked for the compact encoding
+    """
+    response = jsonify(compact(asdict(obj))) if compact_requested() else jsonify(obj)
+    response.vary.add('Accept')
+    return response
+
+
+# etag and body of the last responses of the cacheable routes, sized like the service caches of the same objects
+venue_response_cache: LRUCache[Tuple[str, bytes]] = LRUCache(Config.VENUE_CACHE_SIZE)
+event_response_cache: LRUCache[Tuple[str, bytes]] = LRUCache(Config.EVENT_CACHE_SIZE)
+
+
+def cached_response(cache: LRUCache[Tuple[str, bytes]], key: Hashable, etag: Optional[str],
+                    build: Callable[[], Tuple[str, flask.Response]]) -> flask.Response:
+    """
+    Answer 304 if the client already has etag, otherwise serve the body cached under key if it is still the one of
+    etag. When it is not, or when etag is not known beforehand, build gives the current response and its etag, which
+    are cached: the etag served is always the one of the body.
+    """
+    if etag is not None and etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        cached = cache.get(key)
+        if cached is None or (etag is not None and cached[0] != etag):
+            built_etag, built = build()
+            cached = (built_etag, built.get_data())
+            cache.put(key, cached)
+        etag = cached[0]
+        if etag in request.if_none_match:
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(cached[1], mimetype='application/json')
+    response.set_etag(etag)
+    response.vary.add('Accept')
+    return response
+
 
 @app.route('/')
 def index():
@@ -50,9 +111,17 @@ def create_fake_event():
     return jsonify(event)
 
 
+list_events_schema = Schema({
+    SchemaOptional("venue_id"): And(str, len, ObjectId.is_valid, Use(ObjectId)),
+    SchemaOptional("from_date"): And(str, Use(dateutil.parser.parse)),
+    SchemaOptional("to_date"): And(str, Use(dateutil.parser.parse)),
+})
+
+
 @app.route("/events")
 def list_events():
-    events = service.list_events()
+    content = list_events_schema.validate(request.args.to_dict())
+    events = service.list_events(**content)
     return jsonify(events)
 
 
@@ -70,21 +139,59 @@ def create_event():
     return jsonify(event)
 
 
+@app.route("/events/bulk", methods=["POST"])
+def create_events():
+    content = Schema([create_event_schema]).validate(request.json)
+    events = service.create_events([(item["name"], item["show_date"], item["venue_id"]) for item in content])
+    return jsonify(events)
+
+
 object_id_schema = Schema(And(str, len, ObjectId.is_valid, Use(ObjectId)))
 
 
+def expected_version() -> Optional[int]:
+    """
+    Version of the event the client based its update on, sent back in If-Match with the etag of GET /events/<id>
+    """
+    etags = request.if_match.as_set()
+    if len(etags) == 0:
+        return None
+    parts = next(iter(etags)).split('-')
+    if len(parts) != 3 or not parts[1].isdigit():
+        raise TragosException("If-Match must be an etag of the event")
+    return int(parts[1])
+
+
+def event_etag(event_id: ObjectId, version: int, compact: bool) -> str:
+    return "{}-{}-{}".format(event_id, version, 'compact' if compact else 'full')
+
+
 @app.route("/events/<event_id>", methods=["GET"])
 def get_event(event_id: str):
     object_id = object_id_schema.validate(event_id)
-    event = service.get_event(object_id)
-    return jsonify(event)
+    compact = compact_requested()
+
+    def build():
+        # the event may have changed since its version was read, the etag is the one of the version loaded
+        event = service.get_event(object_id)
+        return event_etag(object_id, event.version, compact), jsonify_negotiated(event, encoding.compact_event)
+
+    # only the version is read when the client or the cache is up to date
+    etag = event_etag(object_id, service.get_event_version(object_id), compact)
+    return cached_response(event_response_cache, (object_id, compact), etag, build)
 
 
 @app.route("/venues/<venue_id>", methods=["GET"])
 def get_venue(venue_id: str):
     object_id = object_id_schema.validate(venue_id)
-    venue = service.get_venue(object_id)
-    return jsonify(venue)
+    compact = compact_requested()
+
+    def build():
+        response = jsonify_negotiated(service.get_venue(object_id), encoding.compact_venue)
+        return hashlib.sha256(response.get_data()).hexdigest()[:32], response
+
+    # venues are not versioned, their etag is a digest of the body served
+    return cached_response(venue_response_cache, (object_id, compact), None, build)
 
 
 group_schema = Schema({
@@ -98,17 +205,62 @@ group_schema = Schema({
 def add_group(event_id: str):
     event_id = object_id_schema.validate(event_id)
     content = group_schema.validate(request.json)
-    event = service.add_group(event_id, **content)
+    event = service.add_group(event_id, **content, expected_version=expected_version())
     return jsonify(event)
 
 
+# csv columns are strings, accessibility is optional and false by default
+csv_group_schema = Schema({
+    "name": And(str, len),
+    "size": And(Use(int), lambda size: size > 0),
+    SchemaOptional("accessibility", default=False): And(str, Use(lambda value: value.strip().lower()),
+                                                        lambda value: value in ('', 'true', 'false', '1', '0'),
+                                                        Use(lambda value: value in ('true', '1')))
+}, ignore_extra_keys=True)
+
+
+def parse_groups_csv(stream) -> List[Dict]:
+    """
+    Read groups from a csv with a header line, validating each line as it is read
+    """
+    groups = []
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    for line_n, row in enumerate(reader, start=2):
+        try:
+            groups.append(csv_group_schema.validate(row))
+        except SchemaError as e:
+            raise TragosException("invalid group on line {}: {}".format(line_n, e))
+    return groups
+
+
+@app.route("/events/<event_id>/groups/bulk", methods=["POST"])
+def add_groups(event_id: str):
+    """
+    Append the groups of a json array or of a csv (name,size,accessibility) to the queue, in one update.
+    With ?compute=true, a compute job is started afterward.
+    """
+    event_id = object_id_schema.validate(event_id)
+    if request.mimetype == 'text/csv':
+        content = parse_groups_csv(request.stream)
+    else:
+        content = Schema([group_schema]).validate(request.json)
+    groups = [Group(group_n=None, **item) for item in content]
+    event = service.add_groups(event_id, groups, expected_version=expected_version())
+
+    job = None
+    if request.args.get('compute') == 'true':
+        job = service.create_compute_job(event_id)
+        job_runner.submit(job.id)
+    return jsonify(event=event, job=job), 202 if job is not None else 200
+
+
 @app.route("/events/<event_id>/groups/<group_n>", methods=["PUT"])
 def update_group(event_id: str, group_n: str):
     event_id = object_id_schema.validate(event_id)
     group_n = Schema(And(str, Use(int))).validate(group_n)
     content = group_schema.validate(request.json)
     group = Group(group_n=group_n, **content)
-    event = service.update_group(event_id, group)
+    event = service.update_group(event_id, group, expected_version=expected_version())
     return jsonify(event)
 
 
@@ -116,28 +268,86 @@ def update_group(event_id: str, group_n: str):
 def delete_group(event_id: str, group_n: str):
     event_id = object_id_schema.validate(event_id)
     group_n = Schema(And(str, Use(int))).validate(group_n)
-    event = service.delete_group(event_id, group_n)
+    event = service.delete_group(event_id, group_n, expected_version=expected_version())
     return jsonify(event)
 
 
 @app.route("/events/<event_id>/compute", methods=["POST"])
 def compute_solution(event_id: str):
     event_id = object_id_schema.validate(event_id)
-    solution = service.compute_solution(event_id)
-    return jsonify(solution)
+    job = service.create_compute_job(event_id)
+    job_runner.submit(job.id)
+    return jsonify(job), 202
+
+
+@app.route("/events/<event_id>/place", methods=["POST"])
+def place_new_groups(event_id: str):
+    """
+    Place the new groups on top of the current solution, or start a compute job if they can't be placed this way
+    """
+    event_id = object_id_schema.validate(event_id)
+    solution = service.place_new_groups(event_id)
+    if solution is None:
+        job = service.create_compute_job(event_id)
+        job_runner.submit(job.id)
+        return jsonify(job), 202
+    return jsonify_negotiated(solution, encoding.compact_solution)
+
+
+def csv_lines(rows) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def ndjson_lines(documents) -> Iterator[str]:
+    for document in documents:
+        yield json.dumps(document, ensure_ascii=False) + '\n'
+
+
+@app.route("/events/<event_id>/export", methods=["GET"])
+def export_assignments(event_id: str):
+    """
+    Stream the seat of each placed spectator, as csv with ?format=csv, as newline-delimited json otherwise
+    """
+    event_id = object_id_schema.validate(event_id)
+    export_format = Schema(And(str, lambda value: value in ('ndjson', 'csv'))).validate(
+        request.args.get('format', 'ndjson'))
+    assignments = service.export_assignments(event_id)
+
+    if export_format == 'csv':
+        header = [field.name for field in fields(SeatAssignment)]
+        response = app.response_class(csv_lines(itertools.chain(
+            [header], (astuple(assignment) for assignment in assignments))), mimetype='text/csv')
+    else:
+        response = app.response_class(ndjson_lines(asdict(assignment) for assignment in assignments),
+                                      mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(event_id, export_format)
+    return response
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id: str):
+    object_id = object_id_schema.validate(job_id)
+    job = service.get_job(object_id)
+    return jsonify(job)
 
 
 @app.route("/events/<event_id>/accessibility/unlock", methods=["POST"])
 def unlock_accessible_seats(event_id: str):
     event_id = object_id_schema.validate(event_id)
-    event = service.unlock_accessible_seats(event_id)
+    event = service.unlock_accessible_seats(event_id, expected_version=expected_version())
     return jsonify(event)
 
 
 @app.route("/events/<event_id>/accessibility/lock", methods=["POST"])
 def lock_accessible_seats(event_id: str):
     event_id = object_id_schema.validate(event_id)
-    event = service.lock_accessible_seats(event_id)
+    event = service.lock_accessible_seats(event_id, expected_version=expected_version())
     return jsonify(event)
 
 
@@ -161,6 +371,16 @@ def handle_page_not_found_error(e: Exception):
     }), 404
 
 
+@app.errorhandler(ConflictException)
+def handle_conflict_error(e: ConflictException):
+    traceback.print_exc()
+    return jsonify(error={
+        "code": 409,
+        "type": "conflict",
+        "message": str(e)
+    }), 409
+
+
 @app.errorhandler(TragosException)
 def handle_tragos_error(e: TragosException):
     traceback.print_exc()
@@ -0,0 +1,177 @@
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import NamedTuple, List, Dict, Any, Optional
+
+from tragos.engine import MetaStateCache, Manager, IMPLEMENTATIONS, create_implementation
+from tragos.fake import create_venue_grid, create_requirements
+from tragos.models import Group
+
+
+class BenchmarkCase(NamedTuple):
+    num_rows: int
+    row_len: int
+    num_groups: int
+    max_group_size: int
+    min_distance: float
+    accessibility_rate: float
+    # all the seats of the first accessible_rows rows are accessible
+    accessible_rows: int = 1
+    # seed of the generated requirements, the search itself is the deterministic one of engine.start
+    seed: int = 0
+
+
+def run_case(case: BenchmarkCase, implementation='indexed', max_expand=100, max_loop=50,
+             time_budget: Optional[float] = None, trace_memory=True, check_closed_set=False) -> Dict[str, Any]:
+    """
+    Generate the venue and the requirements of a case, then time the MetaState build and the search separately.
+    When trace_memory is set, the search is run a second time under tracemalloc to measure its peak memory, so that
+    tracing does not slow down the timed run.
+    When check_closed_set is set, the search is run again with whole states in its closed set, closed_set_exact tells
+    whether it went the same way, i.e. whether state digests skipped no state.
+    """
+    venue = create_venue_grid(case.num_rows, case.row_len,
+                              [(row_n, seat_n) for row_n in range(min(case.accessible_rows, case.num_rows))
+                               for seat_n in range(case.row_len)])
+    requirements = create_requirements(num_groups=case.num_groups, min_distance=case.min_distance,
+                                       accessibility_rate=case.accessibility_rate,
+                                       max_group_size=case.max_group_size, seed=case.seed)
+    meta_state_cache = MetaStateCache(max_size=1)
+
+    start_time = time.perf_counter()
+    meta_state = meta_state_cache.get(venue, requirements)
+    meta_state_time = time.perf_counter() - start_time
+
+    def search(exact_closed_set=False):
+        impl = create_implementation(implementation, venue, requirements, max_expand=max_expand,
+                                     meta_state_cache=meta_state_cache)
+        manager = Manager(impl, requirements, max_loop=max_loop, time_budget=time_budget,
+                          exact_closed_set=exact_closed_set)
+        return impl, manager.run(), manager.stats
+
+    start_time = time.perf_counter()
+    impl, solution, stats = search()
+    search_time = time.perf_counter() - start_time
+
+    result = dict(case._asdict(),
+                  implementation=implementation,
+                  num_seats=venue.num_seats,
+                  num_slots=len(meta_state.slots),
+                  meta_state_time=meta_state_time,
+                  search_time=search_time,
+                  expand_time=stats.expand_time,
+                  evaluate_time=stats.evaluate_time,
+                  save_restore_time=stats.save_restore_time,
+                  build_solution_time=stats.build_solution_time,
+                  num_iterations=stats.num_iterations,
+                  num_states_generated=stats.num_states_generated,
+                  num_duplicates=stats.num_duplicates,
+                  num_closed_states_evicted=stats.num_closed_states_evicted,
+                  max_fringe_size=stats.max_fringe_size,
+                  num_groups_placed=solution.num_groups_placed,
+                  num_groups_declined=solution.num_groups_declined,
+                  truncated=solution.truncated,
+                  covid_score=solution.covid_score,
+                  peak_memory=None,
+                  bytes_per_state=None,
+                  closed_set_exact=None)
+
+    if check_closed_set:
+        _, exact_solution, exact_stats = search(exact_closed_set=True)
+        result['closed_set_exact'] = (exact_stats.num_duplicates == stats.num_duplicates
+                                      and exact_solution.assignments == solution.assignments)
+
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            search()
+            result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            result['bytes_per_state'] = measure_state_size(impl)
+        finally:
+            tracemalloc.stop()
+
+    return result
+
+
+def measure_state_size(impl) -> Optional[float]:
+    """
+    Average memory used by a state, measured on the children of the initial state for a group of one.
+    Must be called while tracemalloc is tracing.
+    """
+    initial_state = impl.create_initial_state()
+    before = tracemalloc.get_traced_memory()[0]
+    states = impl.expand(initial_state, Group(group_n=0, name='benchmark', size=1))
+    used = tracemalloc.get_traced_memory()[0] - before
+    return used / len(states) if states else None
+
+
+def sweep(num_rows: List[int], row_len: List[int], num_groups: List[int], max_group_size: List[int],
+          min_distance: List[float], accessibility_rate: List[float], seeds: List[int]) -> List[BenchmarkCase]:
+    return [BenchmarkCase(num_rows=r, row_len=l, num_groups=g, max_group_size=s, min_distance=d,
+                          accessibility_rate=a, seed=seed)
+            for r, l, g, s, d, a, seed in itertools.product(num_rows, row_len, num_groups, max_group_size,
+                                                            min_distance, accessibility_rate, seeds)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the placement engine, every combination of the given '
+                                                 'values is run')
+    parser.add_argument('--num-rows', dest='num_rows', type=int, nargs='+', default=[10, 30],
+                        help='the numbers of rows')
+    parser.add_argument('--row-len', dest='row_len', type=int, nargs='+', default=[10, 30],
+                        help='the sizes of a row')
+    parser.add_argument('--num-groups', dest='num_groups', type=int, nargs='+', default=[10, 50],
+                        help='the numbers of groups to generate')
+    parser.add_argument('--max-group-size', dest='max_group_size', type=int, nargs='+', default=[6],
+                        help='the maximum sizes of a group accepted')
+    parser.add_argument('--min-distance', dest='min_distance', type=float, nargs='+', default=[1.5],
+                        help='the min distances to keep between people')
+    parser.add_argument('--accessibility-rate', dest='accessibility_rate', type=float, nargs='+', default=[0],
+                        help='the rates of groups that need accessibility')
+    parser.add_argument('--seed', dest='seeds', type=int, nargs='+', default=[0],
+                        help='the seeds used to generate the groups')
+    parser.add_argument('--implementation', dest='implementation', choices=IMPLEMENTATIONS, default='indexed',
+                        help='the search implementation to use')
+    parser.add_argument('--max-expand', dest='max_expand', type=int, default=100, help='the max expansion factor')
+    parser.add_argument('--max-loop', dest='max_loop', type=int, default=50,
+                        help='the max number of iteration when searching')
+    parser.add_argument('--time-budget', dest='time_budget', type=float, default=None,
+                        help='the max number of seconds for each search')
+    parser.add_argument('--no-memory', dest='trace_memory', action='store_false',
+                        help='skip the peak memory measurement, which runs each search twice')
+    parser.add_argument('--check-closed-set', dest='check_closed_set', action='store_true',
+                        help='check that each search skips the same states with an exact closed set')
+    parser.add_argument('--output', dest='output', default=None,
+                        help='the JSON file to write the results to, stdout by default')
+
+    args = parser.parse_args(argv)
+
+    cases = sweep(args.num_rows, args.row_len, args.num_groups, args.max_group_size, args.min_distance,
+                  args.accessibility_rate, args.seeds)
+    results = []
+    for i, case in enumerate(cases):
+        print("[{}/{}] {}".format(i + 1, len(cases), case), file=sys.stderr)
+        results.append(run_case(case, implementation=args.implementation, max_expand=args.max_expand,
+                                max_loop=args.max_loop, time_budget=args.time_budget,
+                                trace_memory=args.trace_memory, check_closed_set=args.check_closed_set))
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'results': results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
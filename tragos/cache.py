@@ -0,0 +1,53 @@
+import threading
+from collections import OrderedDict
+from typing import Generic, TypeVar, Hashable, Optional
+
+V = TypeVar('V')
+
+
+class LRUCache(Generic[V]):
+    """
+    Thread-safe in-process LRU cache, the least recently used entries are dropped beyond max_size.
+    """
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._entries: 'OrderedDict[Hashable, V]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: V):
+        if self._max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __getstate__(self):
+        # locks can't be pickled, this happens when a cache is sent to worker processes
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
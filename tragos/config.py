@@ -31,8 +31,37 @@ class Config:
     BIND_ADDRESS: str = _config_item(str, "TRAGOS_BIND_ADDRESS", ("server", "bind_address"), "127.0.0.1")
     BIND_PORT: int = _config_item(int, "TRAGOS_BIND_PORT", ("server", "bind_port"), 8080)
     FLASK_DEBUG: bool = _config_item(bool, "TRAGOS_FLASK_DEBUG", ("server", "flask_debug"), False)
+    # level of the logs of the api and of the compute workers, INFO shows the stats of each search
+    LOG_LEVEL: str = _config_item(str, "TRAGOS_LOG_LEVEL", ("server", "log_level"), "INFO")
     DATABASE_URL: str = _config_item(str, "TRAGOS_DATABASE_URL", ("database", "url"), "mongodb://localhost:27017/")
     DATABASE_NAME: str = _config_item(str, "TRAGOS_DATABASE_NAME", ("database", "name"), "tragos")
+    # connection pool of each process, timeouts in milliseconds, 0 socket timeout meaning none
+    DATABASE_MAX_POOL_SIZE: int = _config_item(int, "TRAGOS_DATABASE_MAX_POOL_SIZE", ("database", "max_pool_size"), 100)
+    DATABASE_MIN_POOL_SIZE: int = _config_item(int, "TRAGOS_DATABASE_MIN_POOL_SIZE", ("database", "min_pool_size"), 0)
+    DATABASE_CONNECT_TIMEOUT: int = _config_item(int, "TRAGOS_DATABASE_CONNECT_TIMEOUT",
+                                                 ("database", "connect_timeout"), 20000)
+    DATABASE_SERVER_SELECTION_TIMEOUT: int = _config_item(int, "TRAGOS_DATABASE_SERVER_SELECTION_TIMEOUT",
+                                                          ("database", "server_selection_timeout"), 30000)
+    DATABASE_SOCKET_TIMEOUT: int = _config_item(int, "TRAGOS_DATABASE_SOCKET_TIMEOUT",
+                                                ("database", "socket_timeout"), 0)
+    META_STATE_CACHE_SIZE: int = _config_item(int, "TRAGOS_META_STATE_CACHE_SIZE",
+                                              ("engine", "meta_state_cache_size"), 8)
+    # empty means in-memory only
+    META_STATE_CACHE_DIR: str = _config_item(str, "TRAGOS_META_STATE_CACHE_DIR",
+                                             ("engine", "meta_state_cache_dir"), "")
+    # max number of seconds spent searching a solution
+    COMPUTE_TIME_BUDGET: float = _config_item(float, "TRAGOS_COMPUTE_TIME_BUDGET",
+                                              ("engine", "compute_time_budget"), 10)
+    # number of worker processes running compute jobs
+    COMPUTE_WORKERS: int = _config_item(int, "TRAGOS_COMPUTE_WORKERS", ("engine", "compute_workers"), 2)
+    # number of parallel searches per compute, each in its own process, 0 or 1 to disable
+    PORTFOLIO_WORKERS: int = _config_item(int, "TRAGOS_PORTFOLIO_WORKERS", ("engine", "portfolio_workers"), 0)
+    # bounds on the number of states kept by a search, 0 for unbounded
+    MAX_FRINGE_SIZE: int = _config_item(int, "TRAGOS_MAX_FRINGE_SIZE", ("engine", "max_fringe_size"), 0)
+    BEAM_WIDTH: int = _config_item(int, "TRAGOS_BEAM_WIDTH", ("engine", "beam_width"), 0)
+    # number of parsed venues and events, and of serialized responses, kept in memory by the api, 0 to disable
+    VENUE_CACHE_SIZE: int = _config_item(int, "TRAGOS_VENUE_CACHE_SIZE", ("cache", "venue_cache_size"), 16)
+    EVENT_CACHE_SIZE: int = _config_item(int, "TRAGOS_EVENT_CACHE_SIZE", ("cache", "event_cache_size"), 64)
 
     @staticmethod
     def asdict() -> Dict[str, CONFIG_T]:
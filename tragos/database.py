@@ -1,13 +1,34 @@
+from typing import List, Dict, Optional
+
 import pymongo
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, IndexModel
 
 from tragos import Config
 
 
 class DatabaseManager:
 
-    def __init__(self, url: str, name: str):
-        self.client = MongoClient(url)
+    # indexes of each collection, created by ensure_indexes
+    INDEXES = {
+        'events': [
+            IndexModel([('show_date', DESCENDING)]),
+            IndexModel([('venue_id', ASCENDING), ('show_date', DESCENDING)]),
+        ],
+        'jobs': [
+            IndexModel([('event_id', ASCENDING), ('created_at', DESCENDING)]),
+        ],
+    }
+
+    def __init__(self, url: str, name: str, max_pool_size: int = 100, min_pool_size: int = 0,
+                 connect_timeout: int = 20000, server_selection_timeout: int = 30000,
+                 socket_timeout: Optional[int] = None):
+        """
+        Timeouts are in milliseconds, a None socket_timeout meaning none.
+        The client connects lazily, on the first operation.
+        """
+        self.client = MongoClient(url, maxPoolSize=max_pool_size, minPoolSize=min_pool_size,
+                                  connectTimeoutMS=connect_timeout, serverSelectionTimeoutMS=server_selection_timeout,
+                                  socketTimeoutMS=socket_timeout)
         self.db = self.client[name]
 
     def events(self) -> pymongo.collection.Collection:
@@ -16,10 +37,37 @@ class DatabaseManager:
     def venues(self) -> pymongo.collection.Collection:
         return self.db['venues']
 
+    def jobs(self) -> pymongo.collection.Collection:
+        return self.db['jobs']
+
+    def ensure_indexes(self):
+        """
+        Create the missing indexes, existing ones are left untouched
+        """
+        for collection, indexes in self.INDEXES.items():
+            self.db[collection].create_indexes(indexes)
+
+    @staticmethod
+    def insert_many(collection: pymongo.collection.Collection, documents: List[Dict]) -> List:
+        """
+        Insert documents in as few round-trips as possible, return their ids in the same order.
+        The insertion is unordered: if some documents fail, the others are still inserted and a BulkWriteError is
+        raised.
+        """
+        if len(documents) == 0:
+            return []
+        return collection.insert_many(documents, ordered=False).inserted_ids
+
     @staticmethod
     def from_config():
-        return DatabaseManager(Config.DATABASE_URL, Config.DATABASE_NAME)
+        return DatabaseManager(Config.DATABASE_URL, Config.DATABASE_NAME,
+                               max_pool_size=Config.DATABASE_MAX_POOL_SIZE,
+                               min_pool_size=Config.DATABASE_MIN_POOL_SIZE,
+                               connect_timeout=Config.DATABASE_CONNECT_TIMEOUT,
+                               server_selection_timeout=Config.DATABASE_SERVER_SELECTION_TIMEOUT,
+                               socket_timeout=Config.DATABASE_SOCKET_TIMEOUT or None)
 
 
 if __name__ == '__main__':
     db_manager = DatabaseManager.from_config()
+    db_manager.ensure_indexes()
@@ -0,0 +1,104 @@
+"""
+Compact encoding of the big parts of the documents, used in database storage and optionally in api responses.
+
+A solution grid is stored as one status string per row ('.' empty, 'o' occupied, 'x' blocked), slot_n and group_n
+being listed per row for its occupied seats only, in the order they appear in the status string.
+The seats of a venue row are stored as columns, one list per Seat field.
+
+Functions work on documents, as returned by dataclasses.asdict or read from the database. Expanding a document that
+is already in the verbose format leaves it unchanged, so that documents stored before this format are still read.
+"""
+from typing import Dict, List, Optional
+
+from tragos.models import SeatStatus
+
+STATUS_CHARS = {
+    SeatStatus.EMPTY: '.',
+    SeatStatus.OCCUPIED: 'o',
+    SeatStatus.BLOCKED: 'x',
+}
+CHAR_STATUSES = {char: status for status, char in STATUS_CHARS.items()}
+
+SEAT_FIELDS = ['row_name', 'col_name', 'row_n', 'seat_n', 'x', 'y', 'accessible', 'value']
+
+
+def compact_grid(grid: List[List[Dict]]) -> Dict:
+    status = []
+    slot_ns = []
+    group_ns = []
+    for row in grid:
+        status.append(''.join(STATUS_CHARS[seat_solution['status']] for seat_solution in row))
+        occupied = [seat_solution for seat_solution in row if seat_solution['status'] == SeatStatus.OCCUPIED]
+        slot_ns.append([seat_solution['slot_n'] for seat_solution in occupied])
+        group_ns.append([seat_solution['group_n'] for seat_solution in occupied])
+    return {'status': status, 'slot_n': slot_ns, 'group_n': group_ns}
+
+
+def expand_grid(grid) -> List[List[Dict]]:
+    if isinstance(grid, list):
+        return grid
+    res = []
+    for status, slot_ns, group_ns in zip(grid['status'], grid['slot_n'], grid['group_n']):
+        occupied = iter(zip(slot_ns, group_ns))
+        row = []
+        for char in status:
+            seat_status = CHAR_STATUSES[char]
+            if seat_status == SeatStatus.OCCUPIED:
+                slot_n, group_n = next(occupied)
+            else:
+                slot_n, group_n = None, None
+            row.append({'status': seat_status.value, 'slot_n': slot_n, 'group_n': group_n})
+        res.append(row)
+    return res
+
+
+def compact_rows(rows: List[Dict]) -> List[Dict]:
+    return [
+        dict(row, seats={field: [seat[field] for seat in row['seats']] for field in SEAT_FIELDS})
+        for row in rows
+    ]
+
+
+def expand_rows(rows: List[Dict]) -> List[Dict]:
+    res = []
+    for row in rows:
+        seats = row['seats']
+        if isinstance(seats, dict):
+            seats = [dict(zip(SEAT_FIELDS, values)) for values in zip(*(seats[field] for field in SEAT_FIELDS))]
+        res.append(dict(row, seats=seats))
+    return res
+
+
+def compact_solution(solution: Optional[Dict]) -> Optional[Dict]:
+    if solution is None:
+        return None
+    return dict(solution, grid=compact_grid(solution['grid']))
+
+
+def expand_solution(solution: Optional[Dict]) -> Optional[Dict]:
+    if solution is None:
+        return None
+    return dict(solution, grid=expand_grid(solution['grid']))
+
+
+def compact_venue(venue: Dict) -> Dict:
+    return dict(venue, rows=compact_rows(venue['rows']))
+
+
+def expand_venue(venue: Dict) -> Dict:
+    return dict(venue, rows=expand_rows(venue['rows']))
+
+
+def compact_event(event: Dict) -> Dict:
+    """
+    Only the solution of an event is compacted, the solutions of its history items are kept as they are
+    """
+    if 'solution' not in event:
+        return event
+    return dict(event, solution=compact_solution(event['solution']))
+
+
+def expand_event(event: Dict) -> Dict:
+    if 'solution' not in event:
+        return event
+    return dict(event, solution=expand_solution(event['solution']))
@@ -1,17 +1,30 @@
 import argparse
+import cProfile
+import hashlib
 import heapq
 import itertools
-from copy import deepcopy
-from itertools import islice, takewhile
-from math import sqrt
-from typing import NamedTuple, List, Dict, Generator, Tuple, cast, Optional
-
+import logging
+import os
+import pickle
+import pstats
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field, fields, replace
+from itertools import islice
+from typing import NamedTuple, List, Dict, Generator, Tuple, cast, Optional, Callable
+
+import numpy as np
+
+from tragos.cache import LRUCache
 from tragos.fake import create_requirements, create_venue_grid
-from tragos.models import Group, Requirements, Solution, SeatSolution, SeatStatus, Slot
+from tragos.models import Group, Requirements, Solution, SeatSolution, SeatStatus, Slot, ComputeProgress
 from tragos.models import Venue
+from tragos.spatial import SpatialIndex, GridSpatialIndex
 
 
 class State:
+    __slots__ = ()
 
     def __eq__(self, other):
         raise NotImplementedError
@@ -19,52 +32,159 @@ class State:
     def __hash__(self):
         raise NotImplementedError
 
+    def digest(self) -> bytes:
+        """
+        Fixed size fingerprint of the state, equal states having the same one: used as a compact exact key
+        """
+        raise NotImplementedError
+
     def __repr__(self):
         raise NotImplementedError
 
 
 class Fringe:
-    def __init__(self):
+    """
+    Priority queue of states to explore.
+    It supports a checkpoint/rollback mechanism based on an undo log: entries pushed after the checkpoint are
+    recognized by their counter, entries popped since the checkpoint are logged, so nothing is copied on checkpoint.
+    States with the same score and cursor are popped in insertion order, or in a random order if a seed is given.
+    Memory can be bounded: max_size caps the number of states, beam_width the number of states per cursor. When a
+    limit is exceeded, the worst scored states are evicted until only 3/4 of the limit remain, so that eviction cost
+    is amortized.
+    """
+
+    def __init__(self, seed: Optional[int] = None, max_size: Optional[int] = None, beam_width: Optional[int] = None):
         self._heap = []
-        self._counter = itertools.count()
+        self._counter = 0
+        self._checkpoint = None
+        self._undo_log = []
+        self._random = random.Random(seed) if seed is not None else None
+        self._max_size = max_size
+        self._beam_width = beam_width
+        self._sizes_by_cursor = Counter()
+        self.num_evicted = 0
 
     def push(self, state: State, cursor: int, score: float):
-        # heapq.heappush(self._heap, (-cursor, -score, next(self._counter), state))
-        heapq.heappush(self._heap, (-score, -cursor, next(self._counter), state))
+        tie_breaker = self._random.random() if self._random is not None else 0
+        # heapq.heappush(self._heap, (-cursor, -score, tie_breaker, self._counter, state))
+        heapq.heappush(self._heap, (-score, -cursor, tie_breaker, self._counter, state))
+        self._counter += 1
+        self._sizes_by_cursor[cursor] += 1
+
+        if self._beam_width is not None and self._sizes_by_cursor[cursor] > self._beam_width:
+            self.__evict(max(1, self._beam_width * 3 // 4), cursor=cursor)
+        if self._max_size is not None and len(self._heap) > self._max_size:
+            self.__evict(max(1, self._max_size * 3 // 4))
+
+    def __evict(self, keep: int, cursor: Optional[int] = None):
+        """
+        Keep only the best states, among the ones at the given cursor if any or among all states
+        """
+        if cursor is None:
+            self._heap = heapq.nsmallest(keep, self._heap)
+        else:
+            others = [entry for entry in self._heap if -entry[1] != cursor]
+            kept = heapq.nsmallest(keep, (entry for entry in self._heap if -entry[1] == cursor))
+            self._heap = others + kept
+        heapq.heapify(self._heap)
+        self.__count_sizes()
+
+    def __count_sizes(self):
+        previous_size = sum(self._sizes_by_cursor.values())
+        self._sizes_by_cursor = Counter(-entry[1] for entry in self._heap)
+        self.num_evicted += max(0, previous_size - len(self._heap))
 
     def pop(self) -> Tuple[State, int]:
-        # minus_cursor, minus_score, counter, state = heapq.heappop(self._heap)
-        minus_score, minus_cursor, counter, state = heapq.heappop(self._heap)
+        entry = heapq.heappop(self._heap)
+        self._sizes_by_cursor[-entry[1]] -= 1
+        if self._checkpoint is not None and entry[3] < self._checkpoint:
+            self._undo_log.append(entry)
+        # minus_cursor, minus_score, tie_breaker, counter, state = entry
+        minus_score, minus_cursor, tie_breaker, counter, state = entry
         return state, -minus_cursor
 
     def peek(self) -> Tuple[State, int]:
-        # minus_cursor, minus_score, counter, state = self._heap[0]
-        minus_score, minus_cursor, counter, state = self._heap[0]
+        # minus_cursor, minus_score, tie_breaker, counter, state = self._heap[0]
+        minus_score, minus_cursor, tie_breaker, counter, state = self._heap[0]
         return state, -minus_cursor
 
     def find(self, cursor) -> Tuple[State, int]:
-        return next((state, -minus_cursor)
-                    # for minus_cursor, minus_score, counter, state in self._heap
-                    for minus_score, minus_cursor, counter, state in self._heap
-                    if -minus_cursor == cursor)
+        """
+        Return the best state at the given cursor
+        """
+        minus_score, minus_cursor, tie_breaker, counter, state = min(
+            entry for entry in self._heap if -entry[1] == cursor)
+        return state, -minus_cursor
+
+    def checkpoint(self):
+        self._checkpoint = self._counter
+        self._undo_log = []
+
+    def rollback(self):
+        """
+        Restore the fringe as it was when checkpoint() was called
+        """
+        assert self._checkpoint is not None
+        self._heap = [entry for entry in self._heap if entry[3] < self._checkpoint]
+        self._heap.extend(self._undo_log)
+        heapq.heapify(self._heap)
+        self._undo_log = []
+        self._sizes_by_cursor = Counter(-entry[1] for entry in self._heap)
 
     def __len__(self) -> int:
         return len(self._heap)
 
 
 class ClosedSet:
-
-    def __init__(self):
-        self._set = set([])
+    """
+    Set of the states already reached.
+    Only the digests of states are kept, so that states evicted from the fringe can be garbage collected and each entry
+    has the same small size; exact keeps the states themselves instead, to check that digests give the same search.
+    Memory can be bounded: beyond max_size, the oldest states are forgotten until only 3/4 of it remain. A forgotten
+    state may be explored again if it is reached again, nothing is skipped.
+    """
+
+    def __init__(self, max_size: Optional[int] = None, exact=False):
+        # insertion ordered, so that the oldest entries are the first ones
+        self._keys = {}
+        self._undo_log = None
+        self._max_size = max_size
+        self._exact = exact
+        self.num_evicted = 0
+
+    def __key(self, state: State):
+        return state if self._exact else state.digest()
 
     def put(self, state: State):
-        self._set.add(state)
+        key = self.__key(state)
+        if self._undo_log is not None and key not in self._keys:
+            self._undo_log.append(key)
+        self._keys[key] = None
+        if self._max_size is not None and len(self._keys) > self._max_size:
+            self.__evict(max(1, self._max_size * 3 // 4))
+
+    def __evict(self, keep: int):
+        for key in list(islice(self._keys, len(self._keys) - keep)):
+            del self._keys[key]
+            self.num_evicted += 1
 
     def contains(self, state: State) -> bool:
-        return state in self._set
+        return self.__key(state) in self._keys
+
+    def checkpoint(self):
+        self._undo_log = []
+
+    def rollback(self):
+        """
+        Forget every state put since checkpoint() was called
+        """
+        assert self._undo_log is not None
+        for key in self._undo_log:
+            self._keys.pop(key, None)
+        self._undo_log = []
 
     def __len__(self) -> int:
-        return len(self._set)
+        return len(self._keys)
 
 
 class Implementation:
@@ -72,6 +192,10 @@ class Implementation:
     def create_initial_state(self) -> State:
         raise NotImplementedError
 
+    # state where groups already occupy these slots, raise ValueError if they are not compatible
+    def create_state(self, slots: List[Slot]) -> State:
+        raise NotImplementedError
+
     def expand(self, state: State, group: Group) -> List[State]:
         raise NotImplementedError
 
@@ -85,6 +209,9 @@ class Implementation:
     def as_grid(self, state: State) -> List[List[SeatSolution]]:
         raise NotImplementedError
 
+    def count_seats(self, state: State) -> Dict[SeatStatus, int]:
+        raise NotImplementedError
+
 
 class IndexedSlot(NamedTuple):
     row_n: int
@@ -97,12 +224,33 @@ class IndexedSeat(NamedTuple):
     seat_n: int
 
 
+def iterate_bits(value: int) -> Generator[int, None, None]:
+    # jump from one set bit to the next by isolating the lowest one, cost scales with the number of bits set
+    while value:
+        lowest = value & -value
+        yield lowest.bit_length() - 1
+        value ^= lowest
+
+
+def popcount(value: int) -> int:
+    return bin(value).count('1')
+
+
 class BitSetIndex:
+    __slots__ = ('_size', '_value')
 
     def __init__(self, size, value=0):
         self._size = size
         self._value = value
 
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def value(self) -> int:
+        return self._value
+
     def __repr__(self):
         return ("{0:0" + str(self._size) + "b}").format(self._value)[::-1]
 
@@ -125,23 +273,33 @@ class BitSetIndex:
         self._value = (~self._value) & ((1 << self._size) - 1)
 
     def iterate(self) -> Generator[int, None, None]:
-        mask = 1
-        for i in range(self._size):
-            if self._value & mask != 0:
-                yield i
-            mask <<= 1
+        return iterate_bits(self._value)
 
     def any(self) -> bool:
         return self._value != 0
 
+    def count(self) -> int:
+        return popcount(self._value)
+
+    def first(self) -> int:
+        """
+        Index of the lowest bit set, -1 if none
+        """
+        return (self._value & -self._value).bit_length() - 1
+
+    def nth(self, n: int) -> int:
+        """
+        Index of the n-th bit set (starting from 0), -1 if there are not enough bits set
+        """
+        return next(islice(self.iterate(), n, None), -1)
+
     def clone(self) -> 'BitSetIndex':
         return BitSetIndex(size=self._size, value=self._value)
 
     @staticmethod
     def from_list(bool_array: List[bool]) -> 'BitSetIndex':
-        value = 0
-        for b in reversed(bool_array):
-            value = (value << 1) | (1 if b else 0)
+        # parsing a binary string is linear, unlike shifting the value once per item
+        value = int(''.join('1' if b else '0' for b in reversed(bool_array)), 2) if len(bool_array) > 0 else 0
         return BitSetIndex(size=len(bool_array), value=value)
 
     @staticmethod
@@ -170,25 +328,44 @@ class BitSetIndex:
 
 class MetaState:
 
-    def __init__(self, venue: Venue, requirements: Requirements):
+    def __init__(self, venue: Venue, requirements: Requirements, spatial_index: Optional[SpatialIndex] = None):
         self._venue = venue
         self._num_rows = len(venue.rows)
         self._num_seats = venue.num_seats
         self._max_group_size = requirements.max_group_size
         self._min_distance = requirements.min_distance
 
+        self.seats = self.__compute_seats()
+        self.seat_index = {seat: seat_i for seat_i, seat in enumerate(self.seats)}
+
         self.slots = self.__compute_slots()
         self.slot_index = self.__compute_slot_index()
         self.slots_by_size = self.__compute_slots_by_size()
         self.slots_by_seat = self.__compute_slots_by_seat()
 
-        self.distances = self.__compute_distances()
+        # a grid whose cells match the query radius makes each neighbor lookup visit only 9 cells
+        self._spatial_index = spatial_index if spatial_index is not None else GridSpatialIndex(
+            venue, cell_size=self._min_distance if self._min_distance > 0 else 1)
+        self.neighbors = self.__compute_neighbors()
 
         # given a slot that we wish to occupy, return all other slots that are still available after it
         self.slots_by_safety = self.__compute_slots_by_safety()
         # return true => all accessible slots, false => all slots that do not block or occupy accessible slots
         self.slots_by_accessibility = self.__compute_slots_by_accessibility()
 
+        # what placing a group in a slot changes in a state: the value of its seats, the seats it occupies and the
+        # other seats it blocks, as seat-indexed bitsets
+        self.slots_value = self.__compute_slots_value()
+        self.slots_seats = self.__compute_slots_seats()
+        self.slots_blocked_seats = self.__compute_slots_blocked_seats()
+
+        # tables derived from these ones by other implementations, built on first use and cached along with them
+        self.derived: Dict[str, object] = {}
+
+    def __compute_seats(self) -> List[IndexedSeat]:
+        return list(dict.fromkeys(IndexedSeat(row_n=seat.row_n, seat_n=seat.seat_n)
+                                  for row in self._venue.rows for seat in row.seats))
+
     def __compute_slots(self) -> List[IndexedSlot]:
         slots = []
         for row in self._venue.rows:
@@ -211,55 +388,86 @@ class MetaState:
         return slots_by_size
 
     def __compute_slots_by_seat(self) -> Dict[IndexedSeat, BitSetIndex]:
+        # a slot only covers seats of its own row, and slots of a row are contiguous: each row is computed as a small
+        # (seats x slots of the row) matrix, whose lines are packed then shifted to the position of the row's slots
+        slot_row_n = np.array([slot.row_n for slot in self.slots], dtype=np.int64)
+        slot_start = np.array([slot.seat_n for slot in self.slots], dtype=np.int64)
+        slot_end = slot_start + np.array([slot.size for slot in self.slots], dtype=np.int64)
+
         slots_by_seat = {}
         for row in self._venue.rows:
-            for seat in row.seats:
-                slots_by_seat[IndexedSeat(seat.row_n, seat.seat_n)] = BitSetIndex.from_list([
-                    slot.row_n == seat.row_n and slot.seat_n <= seat.seat_n < slot.seat_n + slot.size
-                    for slot in self.slots
-                ])
+            row_slots = np.flatnonzero(slot_row_n == row.row_n)
+            first, last = (int(row_slots[0]), int(row_slots[-1]) + 1) if len(row_slots) > 0 else (0, 0)
+            seat_ns = np.array([seat.seat_n for seat in row.seats], dtype=np.int64)[:, np.newaxis]
+            covered = ((slot_row_n[first:last] == row.row_n)
+                       & (slot_start[first:last] <= seat_ns) & (seat_ns < slot_end[first:last]))
+            for seat, seat_bytes in zip(row.seats, np.packbits(covered, axis=1, bitorder='little')):
+                slots_by_seat[IndexedSeat(seat.row_n, seat.seat_n)] = BitSetIndex(
+                    size=len(self.slots), value=int.from_bytes(seat_bytes.tobytes(), 'little') << first)
         return slots_by_seat
 
-    # TODO: replace this by R-Tree efficient spatial index
-    def __compute_distances(self) -> Dict[Tuple[int, int], List[Tuple[float, int, int]]]:
-        distances = {}
+    def __compute_neighbors(self) -> Dict[IndexedSeat, List[IndexedSeat]]:
+        """
+        For each seat, all other seats closer than min_distance
+        """
+        neighbors = {}
         for row in self._venue.rows:
             for seat in row.seats:
-                one_seat_distances = []
-                for sub_row in self._venue.rows:
-                    for sub_seat in sub_row.seats:
-                        if seat.row_n != sub_seat.row_n or seat.seat_n != sub_seat.seat_n:
-                            one_seat_distances.append((
-                                sqrt((seat.x - sub_seat.x) ** 2 + (seat.y - sub_seat.y) ** 2),
-                                sub_seat.row_n,
-                                sub_seat.seat_n
-                            ))
-                one_seat_distances.sort()
-                distances[(seat.row_n, seat.seat_n)] = one_seat_distances
-        return distances
+                neighbors[IndexedSeat(seat.row_n, seat.seat_n)] = [
+                    IndexedSeat(row_n=other.row_n, seat_n=other.seat_n)
+                    for other in self._spatial_index.within(seat.x, seat.y, self._min_distance)
+                    if seat.row_n != other.row_n or seat.seat_n != other.seat_n
+                ]
+        return neighbors
 
     def __compute_slots_by_safety(self) -> List[BitSetIndex]:
-        slots_by_safety = []
-        for slot_n, slot in enumerate(self.slots):
-            impacted_indexes = []
-            for seat in self.__seats_to_block(slot):
-                impacted_indexes.append(self.slots_by_seat[seat])
-            for seat_n in range(slot.seat_n, slot.seat_n + slot.size):
-                impacted_indexes.append(self.slots_by_seat[IndexedSeat(row_n=slot.row_n, seat_n=seat_n)])
+        # slots made unavailable by occupying one seat: the ones covering the seat or one of its neighbors
+        slots_blocked_by_seat = {
+            seat: BitSetIndex.union([self.slots_by_seat[seat]] + [self.slots_by_seat[other]
+                                                                  for other in self.neighbors[seat]])
+            for seat in self.seats
+        }
 
-            index = BitSetIndex.union(impacted_indexes)
+        slots_by_safety = []
+        for slot in self.slots:
+            index = BitSetIndex.union([slots_blocked_by_seat[seat] for seat in self.__seats_of(slot)])
             index.inverse()
             slots_by_safety.append(index)
-
         return slots_by_safety
 
-    def __seats_to_block(self, slot: IndexedSlot) -> List[IndexedSeat]:
-        res = []
-        for seat_n in range(slot.seat_n, slot.seat_n + slot.size):
-            for distance, other_row_n, other_seat_n in takewhile(lambda x: x[0] < self._min_distance,
-                                                                 self.distances[(slot.row_n, seat_n)]):
-                res.append(IndexedSeat(row_n=other_row_n, seat_n=other_seat_n))
-        return res
+    @staticmethod
+    def __seats_of(slot: IndexedSlot) -> List[IndexedSeat]:
+        return [IndexedSeat(row_n=slot.row_n, seat_n=seat_n) for seat_n in range(slot.seat_n, slot.seat_n + slot.size)]
+
+    def __compute_slots_value(self) -> List[float]:
+        return [
+            sum(self._venue.rows[slot.row_n].seats[seat_n].value
+                for seat_n in range(slot.seat_n, slot.seat_n + slot.size))
+            for slot in self.slots
+        ]
+
+    def __compute_slots_seats(self) -> List[BitSetIndex]:
+        slots_seats = []
+        for slot in self.slots:
+            index = BitSetIndex(size=len(self.seats))
+            for seat_n in range(slot.seat_n, slot.seat_n + slot.size):
+                index.add(self.seat_index[IndexedSeat(row_n=slot.row_n, seat_n=seat_n)])
+            slots_seats.append(index)
+        return slots_seats
+
+    def __compute_slots_blocked_seats(self) -> List[BitSetIndex]:
+        neighbors_index = {}
+        for seat in self.seats:
+            neighbors_index[seat] = BitSetIndex(size=len(self.seats))
+            for other in self.neighbors[seat]:
+                neighbors_index[seat].add(self.seat_index[other])
+
+        slots_blocked_seats = []
+        for slot_n, slot in enumerate(self.slots):
+            index = BitSetIndex.union([neighbors_index[seat] for seat in self.__seats_of(slot)])
+            # seats of a large group are neighbors of each other, they are occupied, not blocked
+            slots_blocked_seats.append(BitSetIndex.intersect([index, BitSetIndex.inverted(self.slots_seats[slot_n])]))
+        return slots_blocked_seats
 
     def __compute_slots_by_accessibility(self) -> Dict[bool, BitSetIndex]:
         accessible_indices = []
@@ -283,11 +491,98 @@ class MetaState:
         return {True: accessible_index, False: non_accessible_index}
 
 
+class MetaStateCache:
+    """
+    LRU cache of MetaState, keyed by a fingerprint of the venue geometry and of the distancing rules.
+    If a directory is given, entries are also pickled there so that the cache is warm after a restart.
+    """
+
+    # bump this whenever the content of MetaState changes, so that stale pickles are ignored
+    VERSION = 5
+
+    def __init__(self, max_size: int = 8, directory: Optional[str] = None):
+        self._directory = directory
+        self._entries: LRUCache[MetaState] = LRUCache(max_size)
+
+    @staticmethod
+    def fingerprint(venue: Venue, requirements: Requirements) -> str:
+        digest = hashlib.sha256()
+        digest.update(repr((MetaStateCache.VERSION, requirements.max_group_size, requirements.min_distance)).encode())
+        for row in venue.rows:
+            digest.update(repr([
+                (seat.row_n, seat.seat_n, seat.x, seat.y, seat.accessible, seat.value) for seat in row.seats
+            ]).encode())
+        return digest.hexdigest()
+
+    def get(self, venue: Venue, requirements: Requirements) -> MetaState:
+        key = self.fingerprint(venue, requirements)
+        meta_state = self._entries.get(key)
+        if meta_state is not None:
+            return meta_state
+
+        meta_state = self.__load(key)
+        if meta_state is None:
+            meta_state = MetaState(venue, requirements)
+            self.__dump(key, meta_state)
+        self._entries.put(key, meta_state)
+        return meta_state
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self._directory, "meta_state-{}.pickle".format(key))
+
+    def __load(self, key: str) -> Optional[MetaState]:
+        if not self._directory or not os.path.exists(self.__path(key)):
+            return None
+        try:
+            with open(self.__path(key), 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            logging.warning("Failed to load cached meta state %s, recomputing it", key, exc_info=True)
+            return None
+
+    def __dump(self, key: str, meta_state: MetaState):
+        if not self._directory:
+            return
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            # write then rename, so that a concurrent reader never sees a partial file
+            tmp_path = self.__path(key) + ".{}.tmp".format(os.getpid())
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(meta_state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.__path(key))
+        except OSError:
+            logging.warning("Failed to store meta state %s in %s", key, self._directory, exc_info=True)
+
+
+# by group size, heaps of (-value, slot_n) of occupied slots
+SlotHeaps = Dict[int, List[Tuple[float, int]]]
+
+
 class IndexedState(State):
+    """
+    Bitsets are stored as plain ints, their sizes being held by the MetaState, and __slots__ avoids a __dict__ per
+    state: the fringe holds a lot of them.
+    """
+
+    __slots__ = ('empty_index', 'occupied_index', 'occupied_seats', 'blocked_seats', 'occupied_value',
+                 'num_empty_seats')
 
-    def __init__(self, empty_index: BitSetIndex, occupied_index: BitSetIndex):
+    def __init__(self, empty_index: int, occupied_index: int, occupied_seats: int, blocked_seats: int,
+                 occupied_value: float, num_empty_seats: int):
+        # slot-indexed
         self.empty_index = empty_index
         self.occupied_index = occupied_index
+        # seat-indexed, derived from the slot-indexed ones but maintained incrementally when placing groups
+        self.occupied_seats = occupied_seats
+        self.blocked_seats = blocked_seats
+        self.occupied_value = occupied_value
+        self.num_empty_seats = num_empty_seats
 
     def __eq__(self, other: 'IndexedState') -> bool:
         return self.empty_index == other.empty_index and self.occupied_index == other.occupied_index
@@ -295,92 +590,113 @@ class IndexedState(State):
     def __hash__(self):
         return hash((self.empty_index, self.occupied_index))
 
+    def digest(self) -> bytes:
+        # empty_index only depends on the occupied slots
+        return hashlib.blake2b(self.occupied_index.to_bytes((self.occupied_index.bit_length() + 7) // 8, 'little'),
+                               digest_size=16).digest()
+
     def __repr__(self):
-        return repr(self.empty_index) + " | " + repr(self.occupied_index)
+        return "{:b} | {:b}".format(self.empty_index, self.occupied_index)
 
 
 class IndexedImplementation(Implementation):
 
-    def __init__(self, venue: Venue, requirements: Requirements, max_expand=10):
+    def __init__(self, venue: Venue, requirements: Requirements, max_expand=10,
+                 meta_state_cache: Optional[MetaStateCache] = None):
         self._venue = venue
         self._requirements = requirements
-        self._meta_state = MetaState(venue, requirements)
+        if meta_state_cache is not None:
+            self._meta_state = meta_state_cache.get(venue, requirements)
+        else:
+            self._meta_state = MetaState(venue, requirements)
         self._max_expand = max_expand
 
     def create_initial_state(self) -> IndexedState:
-        return IndexedState(empty_index=BitSetIndex.from_list([True] * len(self._meta_state.slots)),
-                            occupied_index=BitSetIndex.from_list([False] * len(self._meta_state.slots)))
+        return self.__initial_state()
+
+    def __initial_state(self) -> IndexedState:
+        return IndexedState(empty_index=(1 << len(self._meta_state.slots)) - 1,
+                            occupied_index=0,
+                            occupied_seats=0,
+                            blocked_seats=0,
+                            occupied_value=0,
+                            num_empty_seats=len(self._meta_state.seats))
+
+    def create_state(self, slots: List[Slot]) -> IndexedState:
+        state = self.__initial_state()
+        for slot in slots:
+            slot_index = self._meta_state.slot_index.get(
+                IndexedSlot(row_n=slot.row_n, seat_n=slot.seat_n, size=slot.size))
+            if slot_index is None or state.empty_index & slot_index.value == 0:
+                raise ValueError("Slot row_n={} seat_n={} size={} is not available".format(
+                    slot.row_n, slot.seat_n, slot.size))
+            state = self.__place_group(state, slot_index.first())
+        return state
 
     def expand(self, state: IndexedState, group: Group) -> List[IndexedState]:
         expanded_states = []
 
-        slots_index_intermediate = BitSetIndex.intersect([
-            state.empty_index,
-            self._meta_state.slots_by_size[group.size],
-        ])
+        slots_index = state.empty_index & self._meta_state.slots_by_size[group.size].value
 
         if group.slot is not None:
-            slots_index = BitSetIndex.intersect([
-                slots_index_intermediate,
-                self._meta_state.slot_index[IndexedSlot(
-                    row_n=group.slot.row_n, seat_n=group.slot.seat_n, size=group.slot.size)],
-            ])
+            slots_index &= self._meta_state.slot_index[IndexedSlot(
+                row_n=group.slot.row_n, seat_n=group.slot.seat_n, size=group.slot.size)].value
         elif group.accessibility:
-            slots_index = BitSetIndex.intersect([
-                slots_index_intermediate,
-                self._meta_state.slots_by_accessibility[True]
-            ])
+            slots_index &= self._meta_state.slots_by_accessibility[True].value
         elif self._requirements.lock_accessibility:
-            slots_index = BitSetIndex.intersect(
-                [slots_index_intermediate, self._meta_state.slots_by_accessibility[False]])
-        else:
-            slots_index = slots_index_intermediate
+            slots_index &= self._meta_state.slots_by_accessibility[False].value
 
-        for slot_n in islice(slots_index.iterate(), self._max_expand):
+        for slot_n in islice(iterate_bits(slots_index), self._max_expand):
             expanded_states.append(self.__place_group(state, slot_n))
         return expanded_states
 
     def __place_group(self, prev_state: IndexedState, slot_n: int) -> IndexedState:
-        impact_indexes = self._meta_state.slots_by_safety[slot_n]
-        empty_index = BitSetIndex.intersect([impact_indexes, prev_state.empty_index])
-        occupied_index = prev_state.occupied_index.clone()
-        occupied_index.add(slot_n)
-        return IndexedState(empty_index, occupied_index)
-
-    def evaluate(self, state: IndexedState, cursor: int) -> int:
-        score = 2 * cursor * self._venue.num_seats
-
-        for row in self._venue.rows:
-            for seat in row.seats:
-                index = self._meta_state.slots_by_seat[IndexedSeat(seat_n=seat.seat_n, row_n=seat.row_n)]
-                if BitSetIndex.intersect([index, state.occupied_index]).any():
-                    score += 2 * seat.value
-                elif BitSetIndex.intersect([index, state.empty_index]).any():
-                    score += 1
-        return score
+        meta_state = self._meta_state
+        # an available slot is never within min_distance of an occupied seat, so its neighbors are not occupied
+        occupied_seats = prev_state.occupied_seats | meta_state.slots_seats[slot_n].value
+        blocked_seats = prev_state.blocked_seats | meta_state.slots_blocked_seats[slot_n].value
+        return IndexedState(empty_index=prev_state.empty_index & meta_state.slots_by_safety[slot_n].value,
+                            occupied_index=prev_state.occupied_index | (1 << slot_n),
+                            occupied_seats=occupied_seats,
+                            blocked_seats=blocked_seats,
+                            occupied_value=prev_state.occupied_value + meta_state.slots_value[slot_n],
+                            num_empty_seats=len(meta_state.seats) - popcount(occupied_seats) - popcount(blocked_seats))
+
+    def evaluate(self, state: IndexedState, cursor: int) -> float:
+        # occupied seats are worth twice their value, empty seats are worth 1, blocked seats nothing
+        return 2 * cursor * self._venue.num_seats + 2 * state.occupied_value + state.num_empty_seats
 
     def assign(self, group_queue: List[Group], state: IndexedState) -> Tuple[List[Slot], Dict[int, int]]:
-
+        """
+        Give each group the best remaining occupied slot of its size: its reserved slot if any, an accessible one if it
+        needs accessibility.
+        Slots are picked from per-size max-heaps keyed by slot value, ties going to the lowest slot_n. A slot taken
+        from one heap is left in the others and skipped when it reaches their top.
+        """
+        meta_state = self._meta_state
         slots = []
         assignments = {}
+        taken = set()
+
+        best_slots, best_accessible_slots, slot_ns_by_position = self.__collect_group_slots(state)
+
+        def pop_best(heap: List[Tuple[float, int]]) -> int:
+            while True:
+                _, slot_n = heapq.heappop(heap)
+                if slot_n not in taken:
+                    return slot_n
 
-        group_slots = self.__collect_group_slots(state)
         for group in group_queue:
             if group.slot is not None:
-                row_n, seat_n = group.slot.row_n, group.slot.seat_n
-                index = group_slots[group.size].index((row_n, seat_n))
-                del group_slots[group.size][index]
+                slot_n = slot_ns_by_position[(group.slot.row_n, group.slot.seat_n, group.size)]
+                assert slot_n not in taken
             elif group.accessibility:
-                # deadly one-liner !!! :o
-                index = next(i for i, (row_n, seat_n) in enumerate(group_slots[group.size])
-                             if BitSetIndex.intersect([self._meta_state.slot_index[
-                                                           IndexedSlot(row_n=row_n, seat_n=seat_n, size=group.size)],
-                                                       self._meta_state.slots_by_accessibility[True]]).any())
-                row_n, seat_n = group_slots[group.size][index]
-                del group_slots[group.size][index]
+                slot_n = pop_best(best_accessible_slots[group.size])
             else:
-                assert len(group_slots[group.size]) > 0
-                row_n, seat_n = group_slots[group.size].pop(0)
+                slot_n = pop_best(best_slots[group.size])
+            taken.add(slot_n)
+
+            row_n, seat_n = meta_state.slots[slot_n].row_n, meta_state.slots[slot_n].seat_n
             slot = Slot(
                 row_n=row_n,
                 seat_n=seat_n,
@@ -391,80 +707,224 @@ class IndexedImplementation(Implementation):
             assignments[group.group_n] = len(slots) - 1
         return slots, assignments
 
-    def __collect_group_slots(self, state: IndexedState) -> Dict[int, List[Tuple[int, int]]]:
-        result = {group_size: [] for group_size in range(1, self._requirements.max_group_size + 1)}
-
-        # aggregate slots by size
-        for slot_n in state.occupied_index.iterate():
-            slot = self._meta_state.slots[slot_n]
-            result[slot.size].append((slot.row_n, slot.seat_n))
-
-        # sort slots by value
-        for group_size, slots in result.items():
-            slots.sort(reverse=True, key=lambda seat: sum(
-                self._venue.rows[seat[0]].seats[seat[1] + i].value
-                for i in range(group_size)))
-
-        return result
+    def __collect_group_slots(self,
+                              state: IndexedState) -> Tuple[SlotHeaps, SlotHeaps, Dict[Tuple[int, int, int], int]]:
+        """
+        Index the occupied slots: heaps of (-value, slot_n) by size, for all of them and for the accessible ones only,
+        and slot_n by (row_n, seat_n, size)
+        """
+        meta_state = self._meta_state
+        accessible = meta_state.slots_by_accessibility[True].value
+        sizes = range(1, self._requirements.max_group_size + 1)
+        best_slots = {group_size: [] for group_size in sizes}
+        best_accessible_slots = {group_size: [] for group_size in sizes}
+        slot_ns_by_position = {}
+
+        for slot_n in iterate_bits(state.occupied_index):
+            slot = meta_state.slots[slot_n]
+            entry = (-meta_state.slots_value[slot_n], slot_n)
+            best_slots[slot.size].append(entry)
+            if accessible >> slot_n & 1:
+                best_accessible_slots[slot.size].append(entry)
+            slot_ns_by_position[(slot.row_n, slot.seat_n, slot.size)] = slot_n
+
+        for heap in itertools.chain(best_slots.values(), best_accessible_slots.values()):
+            heapq.heapify(heap)
+        return best_slots, best_accessible_slots, slot_ns_by_position
 
     def as_grid(self, state: IndexedState) -> List[List[SeatSolution]]:
         grid = []
         for row in self._venue.rows:
             grid_row = []
             for seat in row.seats:
-                seat_slots_index = self._meta_state.slots_by_seat[IndexedSeat(seat_n=seat.seat_n, row_n=seat.row_n)]
-                if BitSetIndex.intersect([state.occupied_index, seat_slots_index]).any():
+                seat_i = self._meta_state.seat_index[IndexedSeat(seat_n=seat.seat_n, row_n=seat.row_n)]
+                if state.occupied_seats >> seat_i & 1:
                     grid_row.append(SeatSolution(status=SeatStatus.OCCUPIED))
-                elif BitSetIndex.intersect([state.empty_index, seat_slots_index]).any():
-                    grid_row.append(SeatSolution(status=SeatStatus.EMPTY))
-                else:
+                elif state.blocked_seats >> seat_i & 1:
                     grid_row.append(SeatSolution(status=SeatStatus.BLOCKED))
+                else:
+                    grid_row.append(SeatSolution(status=SeatStatus.EMPTY))
             grid.append(grid_row)
         return grid
 
+    def count_seats(self, state: IndexedState) -> Dict[SeatStatus, int]:
+        return {
+            SeatStatus.OCCUPIED: popcount(state.occupied_seats),
+            SeatStatus.BLOCKED: popcount(state.blocked_seats),
+            SeatStatus.EMPTY: state.num_empty_seats,
+        }
+
+
+# orders in which the manager can try to place groups, booking order being the fair one
+ORDERINGS = ['booking', 'largest_first', 'smallest_first']
+
+
+@dataclass
+class SearchStats:
+    """
+    Where the time of a run went, times are in seconds
+    """
+    meta_state_time: float = 0
+    # whole run, build_solution included
+    total_time: float = 0
+    expand_time: float = 0
+    evaluate_time: float = 0
+    save_restore_time: float = 0
+    build_solution_time: float = 0
+    # time spent searching a slot, by group_n
+    group_times: Dict[int, float] = field(default_factory=dict)
+
+    # states popped from the fringe and expanded
+    num_iterations: int = 0
+    # states returned by expand
+    num_states_generated: int = 0
+    # generated states already reached through another path
+    num_duplicates: int = 0
+    num_states_evicted: int = 0
+    # states forgotten by the closed set
+    num_closed_states_evicted: int = 0
+    max_fringe_size: int = 0
+    num_groups_declined: int = 0
+
+    # only set when the run is profiled
+    profile: Optional[pstats.Stats] = field(default=None, repr=False)
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Times and counters, without the per-group times and the profile
+        """
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.name not in ('group_times', 'profile')}
+
+    def __str__(self):
+        return ("total {:.3f}s (meta state {:.3f}s, expand {:.3f}s, evaluate {:.3f}s, save/restore {:.3f}s, "
+                "build solution {:.3f}s), {} iterations, {} states generated, {} duplicates, {} evicted, "
+                "{} evicted from closed set, max fringe size {}, {} groups declined").format(
+            self.total_time, self.meta_state_time, self.expand_time, self.evaluate_time, self.save_restore_time,
+            self.build_solution_time, self.num_iterations, self.num_states_generated, self.num_duplicates,
+            self.num_states_evicted, self.num_closed_states_evicted, self.max_fringe_size, self.num_groups_declined)
+
 
 class Manager:
 
-    def __init__(self, impl: Implementation, requirements: Requirements, max_loop=None):
+    # when the fringe is bounded, the closed set keeps this many times more states, popped states staying in it
+    CLOSED_SET_RATIO = 4
+
+    def __init__(self, impl: Implementation, requirements: Requirements, max_loop=None,
+                 time_budget: Optional[float] = None,
+                 progress_callback: Optional[Callable[[ComputeProgress], None]] = None,
+                 placed_groups: Optional[List[Group]] = None,
+                 declined_groups: Optional[List[Group]] = None,
+                 ordering: str = 'booking', seed: Optional[int] = None,
+                 max_fringe_size: Optional[int] = None, beam_width: Optional[int] = None,
+                 profile=False, exact_closed_set=False):
+        """
+        placed_groups and declined_groups let the run resume from a previous one: placed groups must have their slot
+        set and are kept there, declined ones are not tried again, only remaining groups of the queue are placed.
+        ordering (one of ORDERINGS) is the order in which groups without reserved slot nor accessibility are tried,
+        seed randomizes the choice between equally scored states.
+        max_fringe_size and beam_width bound the memory used by the search, see Fringe, and the closed set along with
+        it.
+        profile runs the search under cProfile, the result is in stats.profile.
+        exact_closed_set keeps whole states in the closed set instead of their digests, see ClosedSet.
+        """
         self._impl = impl
-        self._group_queue = []
-        self._declined_groups = []
+        self._group_queue = list(placed_groups) if placed_groups is not None else []
+        self._declined_groups = list(declined_groups) if declined_groups is not None else []
         self._requirements = requirements
-        self._fringe = Fringe()
-        initial_state = impl.create_initial_state()
-        self._fringe.push(initial_state, 0, impl.evaluate(initial_state, 0))
-        self._closed_set = ClosedSet()
+        self._ordering = ordering
+        self._fringe = Fringe(seed=seed, max_size=max_fringe_size, beam_width=beam_width)
+        if len(self._group_queue) > 0:
+            initial_state = impl.create_state([group.slot for group in self._group_queue])
+        else:
+            initial_state = impl.create_initial_state()
+        cursor = len(self._group_queue)
+        self._fringe.push(initial_state, cursor, impl.evaluate(initial_state, cursor))
+        if max_fringe_size is not None:
+            max_closed_size = self.CLOSED_SET_RATIO * max_fringe_size
+        elif beam_width is not None:
+            # at most beam_width states per cursor
+            max_closed_size = self.CLOSED_SET_RATIO * beam_width * (len(requirements.group_queue) + 1)
+        else:
+            max_closed_size = None
+        self._closed_set = ClosedSet(max_size=max_closed_size, exact=exact_closed_set)
+        self._closed_set.put(initial_state)
 
-        # TODO: replace with a timeout
+        # max number of iterations to place one group
         self._max_loop = max_loop
+        # max number of seconds for the whole run, after that the remaining groups are declined
+        self._time_budget = time_budget
+        self._truncated = False
 
-        self._backup = None
+        # called after each group with the current progress of the run
+        self._progress_callback = progress_callback
+        self._profile = profile
+        self.stats = SearchStats()
 
     def run(self) -> Solution:
+        if not self._profile:
+            return self.__run()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return self.__run()
+        finally:
+            profiler.disable()
+            self.stats.profile = pstats.Stats(profiler)
+
+    def __run(self) -> Solution:
+        start_time = time.monotonic()
+        deadline = start_time + self._time_budget if self._time_budget is not None else None
+        known_group_ns = {group.group_n for group in itertools.chain(self._group_queue, self._declined_groups)}
+        remaining_groups = [group for group in self._requirements.group_queue if group.group_n not in known_group_ns]
         # loop
-        print("Starting placement loop")
-        for group in self.__reorder_group_queue(self._requirements.group_queue, self._requirements.lock_accessibility):
-            print("Trying to place group {}".format(group))
+        logging.debug("Starting placement loop")
+        for group in self.__reorder_group_queue(remaining_groups, self._requirements.lock_accessibility,
+                                                self._ordering):
+            if self._truncated:
+                self._declined_groups.append(group)
+                self.stats.num_groups_declined += 1
+                continue
+            logging.debug("Trying to place group %s", group)
+            group_start_time = time.perf_counter()
             self.__save()
             self._group_queue.append(group)
-            success = self.__do_place(max_loop=self._max_loop)
+            success = self.__do_place(max_loop=self._max_loop, deadline=deadline)
             if not success:
-                print("Failed to place group {}... skipping".format(group))
+                logging.debug("Failed to place group %s... skipping", group)
                 del self._group_queue[-1]
                 self.__restore()
                 self._declined_groups.append(group)
+                self.stats.num_groups_declined += 1
             else:
-                print("Succeed to place group {}".format(group))
-                print(self.__print_state(self._fringe.find(cursor=len(self._group_queue))[0]))
-                print("{} seats occupied".format(sum((group.size for group in self._group_queue))))
-                print("{} groups placed".format(len(self._group_queue)))
-
-        return self.__build_solution()
+                logging.debug("Succeed to place group %s, %d groups placed", group, len(self._group_queue))
+                # rendering the grid is costly, only do it when it is logged
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    logging.debug("\n%s", self.__print_state(self._fringe.find(cursor=len(self._group_queue))[0]))
+            self.stats.group_times[group.group_n] = time.perf_counter() - group_start_time
+
+            if self._progress_callback is not None:
+                self._progress_callback(ComputeProgress(
+                    num_groups_total=len(self._requirements.group_queue),
+                    num_groups_placed=len(self._group_queue),
+                    num_groups_declined=len(self._declined_groups),
+                    num_iterations=self.stats.num_iterations,
+                    elapsed=time.monotonic() - start_time,
+                ))
+
+        build_start_time = time.perf_counter()
+        solution = self.__build_solution()
+        self.stats.build_solution_time = time.perf_counter() - build_start_time
+        self.stats.num_states_evicted = self._fringe.num_evicted
+        self.stats.num_closed_states_evicted = self._closed_set.num_evicted
+        self.stats.total_time = time.monotonic() - start_time
+        logging.info("Search stats: %s", self.stats)
+        return solution
 
     @staticmethod
-    def __reorder_group_queue(group_queue: List[Group], lock_accessibility: bool) -> List[Group]:
+    def __reorder_group_queue(group_queue: List[Group], lock_accessibility: bool,
+                              ordering: str = 'booking') -> List[Group]:
         """
-        Put first groups that have a reserved slot, then accessibility (if locked), then others
+        Put first groups that have a reserved slot, then accessibility (if locked), then others sorted by ordering
         """
         locked_queue = []
         accessible_queue = []
@@ -477,6 +937,13 @@ class Manager:
             else:
                 normal_queue.append(group)
 
+        if ordering == 'largest_first':
+            normal_queue.sort(key=lambda group: -group.size)
+        elif ordering == 'smallest_first':
+            normal_queue.sort(key=lambda group: group.size)
+        else:
+            assert ordering == 'booking'
+
         final_queue = locked_queue
         final_queue.extend(accessible_queue)
         final_queue.extend(normal_queue)
@@ -497,24 +964,42 @@ class Manager:
             s += '\n'
         return s
 
-    def __do_place(self, max_loop=None) -> bool:
+    def __do_place(self, max_loop=None, deadline: Optional[float] = None) -> bool:
+        stats = self.stats
         i = 0
         while len(self._fringe) > 0:
 
             if max_loop is not None and i >= max_loop:
-                print("Timeout after {} iterations".format(i))
+                logging.debug("Timeout after %d iterations", i)
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                logging.info("Time budget exhausted after %d iterations", i)
+                self._truncated = True
                 return False
             i += 1
+            stats.num_iterations += 1
 
-            # print("Fringe size = {} / ClosedSet size = {}".format(len(self._fringe), len(self._closed_set)))
             state, cursor = self._fringe.pop()
+            expand_start_time = time.perf_counter()
             expanded_states = self._impl.expand(state, self._group_queue[cursor])
+            stats.expand_time += time.perf_counter() - expand_start_time
+            stats.num_states_generated += len(expanded_states)
 
+            num_pushed = 0
             for expanded_state in expanded_states:
-                self._fringe.push(expanded_state, cursor + 1, self._impl.evaluate(expanded_state, cursor + 1))
+                # the same set of slots can be reached by placing groups in different slots
+                if self._closed_set.contains(expanded_state):
+                    stats.num_duplicates += 1
+                    continue
+                evaluate_start_time = time.perf_counter()
+                score = self._impl.evaluate(expanded_state, cursor + 1)
+                stats.evaluate_time += time.perf_counter() - evaluate_start_time
+                self._fringe.push(expanded_state, cursor + 1, score)
                 self._closed_set.put(expanded_state)
+                num_pushed += 1
+            stats.max_fringe_size = max(stats.max_fringe_size, len(self._fringe))
 
-            if len(expanded_states) > 0 and cursor + 1 == len(self._group_queue):
+            if num_pushed > 0 and cursor + 1 == len(self._group_queue):
                 return True
 
         return False
@@ -528,6 +1013,7 @@ class Manager:
             final_state)
         assignments_dict = cast(Dict[int, Optional[int]], assignments_dict)
         grid = self._impl.as_grid(final_state)
+        seat_counts = self._impl.count_seats(final_state)
 
         for group_n, slot_n in assignments_dict.items():
             slot = slots[slot_n]
@@ -543,13 +1029,13 @@ class Manager:
 
         solution = Solution(
             success=len(self._declined_groups) == 0,
+            truncated=self._truncated,
             num_groups_placed=len(self._group_queue),
             num_groups_declined=len(self._declined_groups),
 
-            # TODO: can be optimized
-            num_seats_occupied=sum((group.size for group in self._group_queue)),
-            num_seats_blocked=sum((sum(seat.status == SeatStatus.BLOCKED for seat in row) for row in grid)),
-            num_seats_empty=sum((sum(seat.status == SeatStatus.EMPTY for seat in row) for row in grid)),
+            num_seats_occupied=seat_counts[SeatStatus.OCCUPIED],
+            num_seats_blocked=seat_counts[SeatStatus.BLOCKED],
+            num_seats_empty=seat_counts[SeatStatus.EMPTY],
 
             # TODO: compute covid score
             covid_score=1,
@@ -562,27 +1048,102 @@ class Manager:
         return solution
 
     def __save(self):
-        self._backup = (deepcopy(self._fringe), deepcopy(self._closed_set))
+        start_time = time.perf_counter()
+        self._fringe.checkpoint()
+        self._closed_set.checkpoint()
+        self.stats.save_restore_time += time.perf_counter() - start_time
 
     def __restore(self):
-        self._fringe, self._closed_set = self._backup
-
+        start_time = time.perf_counter()
+        self._fringe.rollback()
+        self._closed_set.rollback()
+        self.stats.save_restore_time += time.perf_counter() - start_time
+
+
+def start_incremental(venue: Venue, requirements: Requirements, solution: Solution, max_expand=100, max_loop=50,
+                      meta_state_cache: Optional[MetaStateCache] = None, implementation='indexed',
+                      time_budget: Optional[float] = None,
+                      max_fringe_size: Optional[int] = None, beam_width: Optional[int] = None) -> Solution:
+    """
+    Place the groups appended to the queue after the given solution was computed, without moving the groups it placed.
+    Groups declined by a truncated solution may never have been tried, they are tried again along with the new ones.
+    Raise ValueError if the solution does not fit the venue and requirements anymore.
+    """
+    impl = create_implementation(implementation, venue, requirements, max_expand=max_expand,
+                                 meta_state_cache=meta_state_cache)
+
+    placed_groups = []
+    declined_groups = []
+    for group, slot_n in zip(requirements.group_queue, solution.assignments):
+        if slot_n is not None:
+            placed_groups.append(replace(group, slot=solution.slots[slot_n]))
+        elif not solution.truncated:
+            declined_groups.append(group)
+
+    manager = Manager(impl, requirements, max_loop=max_loop, time_budget=time_budget,
+                      placed_groups=placed_groups, declined_groups=declined_groups,
+                      max_fringe_size=max_fringe_size, beam_width=beam_width)
+    return manager.run()
 
-def start(venue: Venue, requirements: Requirements, max_expand=100, max_loop=50) -> Solution:
-    impl = IndexedImplementation(
-        venue=venue,
-        requirements=requirements,
-        max_expand=max_expand,
-    )
 
-    manager = Manager(impl, requirements, max_loop=max_loop)
-    return manager.run()
+IMPLEMENTATIONS = ['indexed', 'packed']
+
+
+def create_implementation(name: str, venue: Venue, requirements: Requirements, max_expand=100,
+                          meta_state_cache: Optional[MetaStateCache] = None) -> Implementation:
+    if name == 'indexed':
+        impl_class = IndexedImplementation
+    elif name == 'packed':
+        # imported here because tragos.packed depends on this module
+        from tragos.packed import PackedImplementation
+        impl_class = PackedImplementation
+    else:
+        raise ValueError("Unknown implementation {}".format(name))
+    return impl_class(venue=venue, requirements=requirements, max_expand=max_expand,
+                      meta_state_cache=meta_state_cache)
+
+
+def start(venue: Venue, requirements: Requirements, max_expand=100, max_loop=50,
+          meta_state_cache: Optional[MetaStateCache] = None, implementation='indexed',
+          time_budget: Optional[float] = None,
+          progress_callback: Optional[Callable[[ComputeProgress], None]] = None,
+          ordering: str = 'booking', seed: Optional[int] = None,
+          max_fringe_size: Optional[int] = None, beam_width: Optional[int] = None) -> Solution:
+    solution, _ = start_with_stats(venue, requirements, max_expand=max_expand, max_loop=max_loop,
+                                   meta_state_cache=meta_state_cache, implementation=implementation,
+                                   time_budget=time_budget, progress_callback=progress_callback,
+                                   ordering=ordering, seed=seed, max_fringe_size=max_fringe_size,
+                                   beam_width=beam_width)
+    return solution
+
+
+def start_with_stats(venue: Venue, requirements: Requirements, max_expand=100, max_loop=50,
+                     meta_state_cache: Optional[MetaStateCache] = None, implementation='indexed',
+                     time_budget: Optional[float] = None,
+                     progress_callback: Optional[Callable[[ComputeProgress], None]] = None,
+                     ordering: str = 'booking', seed: Optional[int] = None,
+                     max_fringe_size: Optional[int] = None, beam_width: Optional[int] = None,
+                     profile=False) -> Tuple[Solution, SearchStats]:
+    """
+    Same as start, also returning where the time went, see SearchStats
+    """
+    start_time = time.perf_counter()
+    impl = create_implementation(implementation, venue, requirements, max_expand=max_expand,
+                                 meta_state_cache=meta_state_cache)
+    meta_state_time = time.perf_counter() - start_time
+
+    manager = Manager(impl, requirements, max_loop=max_loop, time_budget=time_budget,
+                      progress_callback=progress_callback, ordering=ordering, seed=seed,
+                      max_fringe_size=max_fringe_size, beam_width=beam_width, profile=profile)
+    manager.stats.meta_state_time = meta_state_time
+    return manager.run(), manager.stats
 
 
 def print_solution(r: Requirements, s: Solution):
     print("===== Solution =====")
 
     print("success = {}".format(s.success))
+    print("truncated = {}".format(s.truncated))
     print("num_groups_placed = {}".format(s.num_groups_placed))
     print("num_groups_declined = {}".format(s.num_groups_declined))
     print("num_seats_occupied = {}".format(s.num_seats_occupied))
@@ -634,15 +1195,41 @@ def main(argv=None):
                         help='the number of rows')
     parser.add_argument('--row-len', dest='row_len', type=int, default=10,
                         help='the size of a row')
+    parser.add_argument('--time-budget', dest='time_budget', type=float, default=None,
+                        help='the max number of seconds for the whole search')
+    parser.add_argument('--implementation', dest='implementation', choices=IMPLEMENTATIONS, default='indexed',
+                        help='the search implementation to use')
+    parser.add_argument('--max-fringe-size', dest='max_fringe_size', type=int, default=None,
+                        help='the max number of states kept by the search')
+    parser.add_argument('--beam-width', dest='beam_width', type=int, default=None,
+                        help='the max number of states kept per group placed')
+    parser.add_argument('--portfolio', dest='portfolio', action='store_true',
+                        help='run several searches in parallel processes and keep the best, ignores --max-expand')
+    parser.add_argument('--profile', dest='profile', action='store_true',
+                        help='run the search under cProfile and print the most costly functions')
+    parser.add_argument('--verbose', dest='verbose', action='store_true',
+                        help='log each group placement and the grid after it')
 
     args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
 
     requirements = create_requirements(
         num_groups=args.num_groups, min_distance=args.min_distance, accessibility_rate=args.accessibility_rate,
         max_group_size=args.max_group_size)
-    solution = start(venue=create_venue_grid(args.num_rows, args.row_len, []),
-                     requirements=requirements,
-                     max_expand=args.max_expand, max_loop=args.max_loop)
+    venue = create_venue_grid(args.num_rows, args.row_len, [])
+    if args.portfolio:
+        # imported here because tragos.portfolio depends on this module
+        from tragos.portfolio import start_portfolio
+        solution = start_portfolio(venue=venue, requirements=requirements, max_loop=args.max_loop,
+                                   implementation=args.implementation, time_budget=args.time_budget)
+    else:
+        solution, stats = start_with_stats(venue=venue, requirements=requirements,
+                                           max_expand=args.max_expand, max_loop=args.max_loop,
+                                           implementation=args.implementation, time_budget=args.time_budget,
+                                           max_fringe_size=args.max_fringe_size, beam_width=args.beam_width,
+                                           profile=args.profile)
+        if stats.profile is not None:
+            stats.profile.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(30)
 
     print_solution(requirements, solution)
 
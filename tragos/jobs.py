@@ -0,0 +1,88 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from bson import ObjectId
+
+from tragos import Config
+from tragos.database import DatabaseManager
+from tragos.services import MainService
+
+# each worker process owns its service, and so its database connection and its meta state cache
+_worker_service: Optional[MainService] = None
+
+
+def _init_worker():
+    global _worker_service
+    # spawned workers do not inherit the logging configuration of the api
+    logging.basicConfig(level=Config.LOG_LEVEL)
+    _worker_service = MainService(DatabaseManager.from_config())
+
+
+def _run_compute_job(job_id: ObjectId):
+    _worker_service.run_compute_job(job_id)
+
+
+class JobRunner:
+    """
+    Run compute jobs in a pool of worker processes, so that the api stays responsive and several events can be
+    computed at the same time.
+    Jobs status and progress are stored in the database by the workers. When a job can't store its final status
+    itself, because it could not be submitted or its worker process died, it is marked as failed through service.
+    A pool broken by a dead worker is replaced by a new one.
+    """
+
+    def __init__(self, service: MainService, max_workers: int):
+        self._service = service
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor = self.__create_executor()
+
+    def __create_executor(self) -> ProcessPoolExecutor:
+        # workers are spawned rather than forked: they build their own service, nothing must be inherited from the
+        # threaded api process and its database client
+        return ProcessPoolExecutor(max_workers=self._max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker)
+
+    def submit(self, job_id: ObjectId) -> Future:
+        with self._lock:
+            executor = self._executor
+        try:
+            try:
+                future = executor.submit(_run_compute_job, job_id)
+            except BrokenProcessPool:
+                executor = self.__replace_executor(executor)
+                future = executor.submit(_run_compute_job, job_id)
+        except Exception as e:
+            self._service.fail_job(job_id, "can't start the job: {}".format(e))
+            raise
+        future.add_done_callback(lambda f: self.__on_done(job_id, executor, f))
+        return future
+
+    def __replace_executor(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """
+        Replace the executor if it still is the broken one, a broken pool terminates its own processes
+        """
+        with self._lock:
+            if self._executor is broken:
+                logging.warning("Compute worker pool is broken, starting a new one")
+                self._executor = self.__create_executor()
+            return self._executor
+
+    def __on_done(self, job_id: ObjectId, executor: ProcessPoolExecutor, future: Future):
+        if future.cancelled():
+            self._service.fail_job(job_id, "the job was cancelled")
+            return
+        exception = future.exception()
+        if exception is None:
+            return
+        logging.error("Compute job %s failed", job_id, exc_info=exception)
+        self._service.fail_job(job_id, str(exception) or type(exception).__name__)
+        if isinstance(exception, BrokenProcessPool):
+            self.__replace_executor(executor)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
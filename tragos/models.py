@@ -1,7 +1,7 @@
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 from bson import ObjectId
 
@@ -128,6 +128,57 @@ class Solution:
     # seat (row_n, seat_n) -> seat solution
     grid: List[List[SeatSolution]]
 
+    # true if the search was stopped by its time budget, remaining groups being declined
+    truncated: bool = False
+
+
+@dataclass
+class SeatAssignment:
+    """
+    One line of a solution export, one per seat given to a group
+    """
+    group_n: int
+    group_name: str
+    group_size: int
+    slot_n: int
+    row_name: str
+    col_name: str
+
+
+@dataclass
+class ComputeProgress:
+    num_groups_total: int = 0
+    num_groups_placed: int = 0
+    num_groups_declined: int = 0
+    # search iterations so far, all groups included
+    num_iterations: int = 0
+    # seconds
+    elapsed: float = 0
+
+
+class JobStatus(str, Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+
+@dataclass
+class Job:
+    event_id: ObjectId
+    status: JobStatus
+    created_at: datetime
+    progress: ComputeProgress = field(default_factory=ComputeProgress)
+    # where the search time went, see engine.SearchStats.summary, set when status is DONE
+    stats: Optional[Dict[str, float]] = None
+    # set when status is FAILED
+    error: Optional[str] = None
+    _id: Optional[ObjectId] = None
+
+    @property
+    def id(self):
+        return self._id
+
 
 @dataclass
 class Action:
@@ -156,3 +207,36 @@ class Event:
     history: History
     venue_id: ObjectId
     _id: Optional[ObjectId] = None
+    # incremented by every update of the event
+    version: int = 0
+    # incremented by the updates of the requirements that invalidate the solution
+    requirements_version: int = 0
+
+
+@dataclass
+class EventSummary:
+    """
+    Event without its requirements, solution and history, for listings
+    """
+    name: str
+    show_date: datetime
+    venue_id: ObjectId
+    _id: Optional[ObjectId] = None
+
+    @property
+    def id(self):
+        return self._id
+
+
+@dataclass
+class EventRequirements:
+    """
+    The part of an event modified when editing its groups, loaded without the solution and the history
+    """
+    requirements: Requirements
+    _id: Optional[ObjectId] = None
+    version: int = 0
+
+    @property
+    def id(self):
+        return self._id
@@ -0,0 +1,266 @@
+import hashlib
+from typing import List, Optional, Tuple, Dict
+
+import numpy as np
+
+from tragos.engine import IndexedImplementation, IndexedState, MetaState, MetaStateCache, IndexedSlot, IndexedSeat, \
+    State
+from tragos.models import Venue, Requirements, Group, Slot, SeatSolution, SeatStatus
+
+WORD = np.dtype('<u8')
+
+# number of bits set in each byte value
+POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def num_words(size: int) -> int:
+    return (size + 63) // 64
+
+
+def pack(value: int, size: int) -> np.ndarray:
+    """
+    Convert a bitset to an array of little-endian 64 bits words, bit i being bit i % 64 of word i // 64
+    """
+    return np.frombuffer(value.to_bytes(num_words(size) * WORD.itemsize, 'little'), dtype=WORD).copy()
+
+
+def pack_flags(flags: np.ndarray) -> np.ndarray:
+    """
+    Pack a boolean array along its last axis, bit i being flags[..., i]
+    """
+    size = flags.shape[-1]
+    padded = np.zeros(flags.shape[:-1] + (num_words(size) * 64,), dtype=bool)
+    padded[..., :size] = flags
+    return np.packbits(padded, axis=-1, bitorder='little').view(WORD)
+
+
+def set_bits(matrix: np.ndarray, rows: np.ndarray, indices: np.ndarray):
+    """
+    Set bit indices[i] of row rows[i] of a matrix of words, for all i at once
+    """
+    np.bitwise_or.at(matrix, (rows, indices // 64), np.uint64(1) << (indices % 64).astype(WORD))
+
+
+def unpack(words: np.ndarray) -> int:
+    return int.from_bytes(words.tobytes(), 'little')
+
+
+def bits(words: np.ndarray) -> np.ndarray:
+    """
+    Sorted indices of the bits set
+    """
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder='little'))
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """
+    Number of bits set along the last axis
+    """
+    return POPCOUNT_TABLE[words.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+class PackedTables:
+    """
+    The MetaState tables used by PackedImplementation, as rows of uint64 matrices.
+    They are built from the slot and seat layout with vectorized operations over whole matrices, one per seat offset
+    in a slot or per neighbor, and only once per MetaState: see of().
+    """
+
+    def __init__(self, venue: Venue, meta_state: MetaState):
+        num_slots = len(meta_state.slots)
+        num_seats = len(meta_state.seats)
+        slot_words = num_words(num_slots)
+        seat_words = num_words(num_seats)
+
+        slot_row_n = np.array([slot.row_n for slot in meta_state.slots], dtype=np.int64)
+        slot_seat_n = np.array([slot.seat_n for slot in meta_state.slots], dtype=np.int64)
+        slot_size = np.array([slot.size for slot in meta_state.slots], dtype=np.int64)
+
+        seat_grid = np.zeros((len(venue.rows), max((len(row.seats) for row in venue.rows), default=0)),
+                             dtype=np.int64)
+        accessible_seats = np.zeros(num_seats, dtype=bool)
+        for row in venue.rows:
+            for seat in row.seats:
+                seat_i = meta_state.seat_index[IndexedSeat(row_n=seat.row_n, seat_n=seat.seat_n)]
+                seat_grid[seat.row_n, seat.seat_n] = seat_i
+                accessible_seats[seat_i] = seat.accessible
+
+        # for each offset in a slot, the slots long enough to have a seat there and the index of that seat
+        offsets = []
+        for offset in range(int(slot_size.max()) if num_slots > 0 else 0):
+            slot_ns = np.flatnonzero(slot_size > offset)
+            offsets.append((slot_ns, seat_grid[slot_row_n[slot_ns], slot_seat_n[slot_ns] + offset]))
+
+        # each seat followed by its neighbors, padded with the seat itself
+        neighbors = [[seat_i] + [meta_state.seat_index[other] for other in meta_state.neighbors[seat]]
+                     for seat_i, seat in enumerate(meta_state.seats)]
+        width = max(map(len, neighbors), default=1)
+        closed_neighbors = np.array([seat_is + seat_is[:1] * (width - len(seat_is)) for seat_is in neighbors],
+                                    dtype=np.int64).reshape(num_seats, width)
+
+        # slot -> its seats, seat -> the slots covering it
+        self.slots_seats = np.zeros((num_slots, seat_words), dtype=WORD)
+        slots_by_seat = np.zeros((num_seats, slot_words), dtype=WORD)
+        for slot_ns, seat_is in offsets:
+            set_bits(self.slots_seats, slot_ns, seat_is)
+            set_bits(slots_by_seat, seat_is, slot_ns)
+
+        # seat -> its neighbors, and the slots that can't be occupied once it is
+        seat_neighbors = np.zeros((num_seats, seat_words), dtype=WORD)
+        set_bits(seat_neighbors, np.repeat(np.arange(num_seats), closed_neighbors.shape[1]),
+                 closed_neighbors.ravel())
+        seat_unavailable_slots = np.zeros((num_seats, slot_words), dtype=WORD)
+        for column in closed_neighbors.T:
+            seat_unavailable_slots |= slots_by_seat[column]
+
+        unavailable_slots = np.zeros((num_slots, slot_words), dtype=WORD)
+        blocked_seats = np.zeros((num_slots, seat_words), dtype=WORD)
+        accessible_slots = np.ones(num_slots, dtype=bool)
+        for slot_ns, seat_is in offsets:
+            unavailable_slots[slot_ns] |= seat_unavailable_slots[seat_is]
+            blocked_seats[slot_ns] |= seat_neighbors[seat_is]
+            accessible_slots[slot_ns] &= accessible_seats[seat_is]
+
+        all_slots = pack_flags(np.ones(num_slots, dtype=bool))
+        self.slots_by_safety = ~unavailable_slots & all_slots
+        # seats of a large group are neighbors of each other, they are occupied, not blocked
+        self.slots_blocked_seats = blocked_seats & ~self.slots_seats
+        self.slots_by_size = {size: pack_flags(slot_size == size) for size in meta_state.slots_by_size}
+        accessible = pack_flags(accessible_slots)
+        if accessible_slots.any():
+            non_accessible = np.bitwise_and.reduce(self.slots_by_safety[accessible_slots], axis=0)
+        else:
+            non_accessible = ~accessible & all_slots
+        self.slots_by_accessibility = {True: accessible, False: non_accessible}
+        self.slots_value = np.array(meta_state.slots_value, dtype=np.float64)
+
+    @staticmethod
+    def of(venue: Venue, meta_state: MetaState) -> 'PackedTables':
+        """
+        Get the tables of a MetaState, building them on first use: they are kept in its derived tables, so that they
+        are cached along with it
+        """
+        tables = meta_state.derived.get('packed')
+        if tables is None:
+            tables = PackedTables(venue, meta_state)
+            meta_state.derived['packed'] = tables
+        return tables
+
+
+class PackedState(State):
+    __slots__ = ('empty', 'occupied', 'occupied_seats', 'blocked_seats', 'occupied_value', 'num_empty_seats')
+
+    def __init__(self, empty: np.ndarray, occupied: np.ndarray, occupied_seats: np.ndarray,
+                 blocked_seats: np.ndarray, occupied_value: float, num_empty_seats: int):
+        # slot-indexed
+        self.empty = empty
+        self.occupied = occupied
+        # seat-indexed
+        self.occupied_seats = occupied_seats
+        self.blocked_seats = blocked_seats
+        self.occupied_value = occupied_value
+        self.num_empty_seats = num_empty_seats
+
+    def __eq__(self, other: 'PackedState') -> bool:
+        return np.array_equal(self.empty, other.empty) and np.array_equal(self.occupied, other.occupied)
+
+    def __hash__(self):
+        return hash((self.empty.tobytes(), self.occupied.tobytes()))
+
+    def digest(self) -> bytes:
+        # empty only depends on the occupied slots
+        return hashlib.blake2b(self.occupied.tobytes(), digest_size=16).digest()
+
+    def __repr__(self):
+        return repr(self.empty) + " | " + repr(self.occupied)
+
+
+class PackedImplementation(IndexedImplementation):
+    """
+    Same search as IndexedImplementation, but the MetaState bitsets are packed as rows of uint64 matrices, see
+    PackedTables, so that all the candidates of an expansion are computed at once with vectorized bitwise operations.
+    Assignment and grid rendering are delegated to IndexedImplementation.
+    """
+
+    def __init__(self, venue: Venue, requirements: Requirements, max_expand=10,
+                 meta_state_cache: Optional[MetaStateCache] = None):
+        super().__init__(venue, requirements, max_expand=max_expand, meta_state_cache=meta_state_cache)
+        self._num_slots = len(self._meta_state.slots)
+        self._num_seats = len(self._meta_state.seats)
+        tables = PackedTables.of(venue, self._meta_state)
+        self._slots_by_size = tables.slots_by_size
+        self._slots_by_accessibility = tables.slots_by_accessibility
+        self._slots_by_safety = tables.slots_by_safety
+        self._slots_seats = tables.slots_seats
+        self._slots_blocked_seats = tables.slots_blocked_seats
+        self._slots_value = tables.slots_value
+
+    def create_initial_state(self) -> PackedState:
+        return PackedState(empty=pack((1 << self._num_slots) - 1, self._num_slots),
+                           occupied=np.zeros(num_words(self._num_slots), dtype=WORD),
+                           occupied_seats=np.zeros(num_words(self._num_seats), dtype=WORD),
+                           blocked_seats=np.zeros(num_words(self._num_seats), dtype=WORD),
+                           occupied_value=0,
+                           num_empty_seats=self._num_seats)
+
+    def create_state(self, slots: List[Slot]) -> PackedState:
+        state = super().create_state(slots)
+        return PackedState(empty=pack(state.empty_index, self._num_slots),
+                           occupied=pack(state.occupied_index, self._num_slots),
+                           occupied_seats=pack(state.occupied_seats, self._num_seats),
+                           blocked_seats=pack(state.blocked_seats, self._num_seats),
+                           occupied_value=state.occupied_value,
+                           num_empty_seats=state.num_empty_seats)
+
+    def expand(self, state: PackedState, group: Group) -> List[PackedState]:
+        candidates = state.empty & self._slots_by_size[group.size]
+
+        if group.slot is not None:
+            slot_n = self._meta_state.slot_index[IndexedSlot(
+                row_n=group.slot.row_n, seat_n=group.slot.seat_n, size=group.slot.size)].first()
+            locked = np.zeros_like(candidates)
+            locked[slot_n // 64] = np.uint64(1) << np.uint64(slot_n % 64)
+            candidates &= locked
+        elif group.accessibility:
+            candidates &= self._slots_by_accessibility[True]
+        elif self._requirements.lock_accessibility:
+            candidates &= self._slots_by_accessibility[False]
+
+        slot_ns = bits(candidates)[:self._max_expand]
+        if len(slot_ns) == 0:
+            return []
+
+        # one row per expanded state
+        empty = self._slots_by_safety[slot_ns] & state.empty
+        occupied = np.repeat(state.occupied[np.newaxis, :], len(slot_ns), axis=0)
+        occupied[np.arange(len(slot_ns)), slot_ns // 64] |= np.uint64(1) << (slot_ns % 64).astype(WORD)
+        occupied_seats = self._slots_seats[slot_ns] | state.occupied_seats
+        blocked_seats = self._slots_blocked_seats[slot_ns] | state.blocked_seats
+        num_empty_seats = self._num_seats - popcount(occupied_seats) - popcount(blocked_seats)
+        occupied_value = state.occupied_value + self._slots_value[slot_ns]
+
+        return [
+            PackedState(empty[i], occupied[i], occupied_seats[i], blocked_seats[i],
+                        occupied_value=float(occupied_value[i]), num_empty_seats=int(num_empty_seats[i]))
+            for i in range(len(slot_ns))
+        ]
+
+    def evaluate(self, state: PackedState, cursor: int) -> float:
+        return 2 * cursor * self._venue.num_seats + 2 * state.occupied_value + state.num_empty_seats
+
+    def assign(self, group_queue: List[Group], state: PackedState) -> Tuple[List[Slot], Dict[int, int]]:
+        return super().assign(group_queue, self.__to_indexed(state))
+
+    def as_grid(self, state: PackedState) -> List[List[SeatSolution]]:
+        return super().as_grid(self.__to_indexed(state))
+
+    def count_seats(self, state: PackedState) -> Dict[SeatStatus, int]:
+        return super().count_seats(self.__to_indexed(state))
+
+    def __to_indexed(self, state: PackedState) -> IndexedState:
+        return IndexedState(empty_index=unpack(state.empty),
+                            occupied_index=unpack(state.occupied),
+                            occupied_seats=unpack(state.occupied_seats),
+                            blocked_seats=unpack(state.blocked_seats),
+                            occupied_value=state.occupied_value,
+                            num_empty_seats=state.num_empty_seats)
@@ -0,0 +1,113 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple, Optional, List, Tuple
+
+from tragos import engine
+from tragos.engine import MetaStateCache, SearchStats
+from tragos.models import Venue, Requirements, Solution
+
+
+class SearchConfig(NamedTuple):
+    max_expand: int = 100
+    ordering: str = 'booking'
+    seed: Optional[int] = None
+
+
+# the first config is the one engine.start uses by default
+DEFAULT_PORTFOLIO = [
+    SearchConfig(max_expand=100),
+    SearchConfig(max_expand=20),
+    SearchConfig(max_expand=100, ordering='largest_first'),
+    SearchConfig(max_expand=50, ordering='smallest_first'),
+    SearchConfig(max_expand=100, seed=1),
+    SearchConfig(max_expand=50, seed=2),
+    SearchConfig(max_expand=200, ordering='largest_first', seed=3),
+    SearchConfig(max_expand=10, seed=4),
+]
+
+
+class _Problem(NamedTuple):
+    venue: Venue
+    requirements: Requirements
+    meta_state_cache: MetaStateCache
+    implementation: str
+    max_loop: Optional[int]
+    # wall-clock time after which all the searches stop, shared by the worker processes
+    deadline: Optional[float]
+    max_fringe_size: Optional[int]
+    beam_width: Optional[int]
+
+
+# problem shared by all the searches of a worker process
+_problem: Optional[_Problem] = None
+
+
+def _init_worker(problem: _Problem):
+    global _problem
+    _problem = problem
+
+
+def _search(config: SearchConfig) -> Tuple[Solution, SearchStats]:
+    # searches queued behind others only get what remains of the time budget
+    time_budget = max(0.0, _problem.deadline - time.time()) if _problem.deadline is not None else None
+    return engine.start_with_stats(venue=_problem.venue, requirements=_problem.requirements,
+                                   max_expand=config.max_expand, max_loop=_problem.max_loop,
+                                   meta_state_cache=_problem.meta_state_cache, implementation=_problem.implementation,
+                                   time_budget=time_budget, ordering=config.ordering, seed=config.seed,
+                                   max_fringe_size=_problem.max_fringe_size, beam_width=_problem.beam_width)
+
+
+def solution_rank(solution: Solution) -> Tuple[int, float]:
+    """
+    Solutions placing more groups are better, then the ones giving better seats
+    """
+    return solution.num_groups_placed, sum(seat.value for slot in solution.slots for seat in slot.seats)
+
+
+def start_portfolio(venue: Venue, requirements: Requirements, configs: Optional[List[SearchConfig]] = None,
+                    max_workers: Optional[int] = None, max_loop=50,
+                    meta_state_cache: Optional[MetaStateCache] = None, implementation='indexed',
+                    time_budget: Optional[float] = None,
+                    max_fringe_size: Optional[int] = None, beam_width: Optional[int] = None) -> Solution:
+    solution, _ = start_portfolio_with_stats(venue, requirements, configs=configs, max_workers=max_workers,
+                                             max_loop=max_loop, meta_state_cache=meta_state_cache,
+                                             implementation=implementation, time_budget=time_budget,
+                                             max_fringe_size=max_fringe_size, beam_width=beam_width)
+    return solution
+
+
+def start_portfolio_with_stats(venue: Venue, requirements: Requirements, configs: Optional[List[SearchConfig]] = None,
+                               max_workers: Optional[int] = None, max_loop=50,
+                               meta_state_cache: Optional[MetaStateCache] = None, implementation='indexed',
+                               time_budget: Optional[float] = None,
+                               max_fringe_size: Optional[int] = None,
+                               beam_width: Optional[int] = None) -> Tuple[Solution, SearchStats]:
+    """
+    Run one search per config in a pool of processes and return the best solution found, with the stats of the search
+    that found it.
+    The MetaState is computed once before starting the pool: with the 'fork' start method, workers share it with the
+    parent process instead of receiving a pickled copy.
+    time_budget bounds the whole portfolio, not each search: when there are more configs than workers, the searches
+    that start late get less time.
+    """
+    if configs is None:
+        configs = DEFAULT_PORTFOLIO
+    if meta_state_cache is None:
+        meta_state_cache = MetaStateCache(max_size=1)
+    meta_state_cache.get(venue, requirements)
+    deadline = time.time() + time_budget if time_budget is not None else None
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+
+    problem = _Problem(venue=venue, requirements=requirements, meta_state_cache=meta_state_cache,
+                       implementation=implementation, max_loop=max_loop, deadline=deadline,
+                       max_fringe_size=max_fringe_size, beam_width=beam_width)
+    with ProcessPoolExecutor(max_workers=max_workers or min(len(configs), multiprocessing.cpu_count()),
+                             mp_context=context, initializer=_init_worker, initargs=(problem,)) as executor:
+        results = list(executor.map(_search, configs))
+
+    return max(results, key=lambda result: solution_rank(result[0]))
@@ -1,15 +1,20 @@
-from dataclasses import asdict
+import logging
+import time
+from dataclasses import asdict, replace
 from datetime import datetime
 from enum import Enum
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Callable, Union, Type, Iterator
 
 import dacite
 from bson import ObjectId
+from pymongo import ReturnDocument, DESCENDING
 
-from tragos import engine
+from tragos import engine, portfolio, encoding, analysis, Config
+from tragos.cache import LRUCache
 from tragos.database import DatabaseManager
 from tragos.fake import create_requirements, create_venue_grid
-from tragos.models import Event, Requirements, History, Group, Venue, Solution
+from tragos.models import Event, Requirements, History, Group, Venue, Solution, Job, JobStatus, ComputeProgress, \
+    EventSummary, EventRequirements, SeatAssignment
 
 
 class TragosException(Exception):
@@ -20,6 +25,25 @@ class NotFoundException(TragosException):
     pass
 
 
+class ConflictException(TragosException):
+    """
+    The event was modified by someone else since the version the update was based on
+    """
+    pass
+
+
+def _version_filter(version: int) -> Dict:
+    # events stored before versioning have no version field
+    return {'$in': [version, None]} if version == 0 else version
+
+
+def _bump(field: str) -> Dict:
+    """
+    Aggregation expression incrementing a counter that may be missing
+    """
+    return {'$add': [{'$ifNull': ['$' + field, 0]}, 1]}
+
+
 class MainService:
     """
     This class encapsulates the main logic of the application, managing the objects states, dealing with the database,
@@ -30,6 +54,12 @@ class MainService:
         self.database_manager = database_manager
         self.events = database_manager.events()
         self.venues = database_manager.venues()
+        self.jobs = database_manager.jobs()
+        self.meta_state_cache = engine.MetaStateCache(max_size=Config.META_STATE_CACHE_SIZE,
+                                                      directory=Config.META_STATE_CACHE_DIR or None)
+        # parsed objects, events are checked against their version as workers update them from other processes
+        self.venue_cache: LRUCache[Venue] = LRUCache(Config.VENUE_CACHE_SIZE)
+        self.event_cache: LRUCache[Event] = LRUCache(Config.EVENT_CACHE_SIZE)
 
     def create_fake_event(self, name: str, num_rows: int, row_len: int,
                           accessible_seats: List[Tuple[int, int]],
@@ -42,7 +72,7 @@ class MainService:
         venue = create_venue_grid(num_rows, row_len, accessible_seats)
         requirements = create_requirements(num_groups=num_groups, min_distance=min_distance,
                                            accessibility_rate=accessibility_rate)
-        venue_result = self.venues.insert_one(self.__trim_id(asdict(venue)))
+        venue_result = self.venues.insert_one(self.__trim_id(encoding.compact_venue(asdict(venue))))
         event = Event(name=name, show_date=datetime.now(), venue_id=venue_result.inserted_id,
                       requirements=requirements, solution=None, history=History())
         result = self.events.insert_one(self.__trim_id(asdict(event)))
@@ -58,21 +88,99 @@ class MainService:
 
         return {k: v for k, v in d.items() if k != '_id'}
 
-    def list_events(self) -> List[Event]:
+    @staticmethod
+    def __from_dict(data_class, data: Dict):
+        return dacite.from_dict(data_class=data_class, data=data, config=dacite.Config(cast=[Enum]))
+
+    def __find_event(self, event_id: ObjectId, projection: Optional[Dict] = None) -> Dict:
         """
-        List all events
+        Get the raw document of an event, only with the fields of projection if given
         """
-        items = self.events.find()
-        return [Event(**item) for item in items]
+        event = self.events.find_one({'_id': event_id}, projection)
+        if event is None:
+            raise NotFoundException("No event with id={}".format({event_id}))
+        return event
+
+    def __update_event(self, event_id: ObjectId, update: Union[Dict, List[Dict]],
+                       conditions: Optional[Dict] = None, expected_version: Optional[int] = None,
+                       invalidate_solution=False, projection: Optional[Dict] = None,
+                       error: str = "can't update the event",
+                       error_type: Type[TragosException] = TragosException) -> Dict:
+        """
+        Atomically apply an update, made of update operators or of an aggregation pipeline, to an event and bump its
+        version, then drop it from the cache.
+        The update is only applied if the event matches conditions, and if given, if it is still at expected_version.
+        invalidate_solution clears the solution and bumps requirements_version, so that a solution being computed
+        from the previous requirements is not stored.
+        Return the updated event, only with the fields of projection if given.
+        Raise NotFoundException, ConflictException, or error_type with error if conditions are not met.
+        """
+        query = {'_id': event_id}
+        query.update(conditions or {})
+        if expected_version is not None:
+            query['version'] = _version_filter(expected_version)
+
+        if isinstance(update, list):
+            stage = {'version': _bump('version')}
+            if invalidate_solution:
+                stage.update({'solution': None, 'requirements_version': _bump('requirements_version')})
+            update = update + [{'$set': stage}]
+        else:
+            update = dict(update)
+            update['$inc'] = {'version': 1}
+            if invalidate_solution:
+                update['$set'] = dict(update.get('$set', {}), solution=None)
+                update['$inc']['requirements_version'] = 1
+
+        event = self.events.find_one_and_update(query, update, projection=projection,
+                                                return_document=ReturnDocument.AFTER)
+        self.event_cache.invalidate(event_id)
+        if event is None:
+            # only reached when the update failed, find out why
+            version = self.get_event_version(event_id)
+            if expected_version is not None and version != expected_version:
+                raise ConflictException("event {} was modified, its version is {} instead of {}".format(
+                    event_id, version, expected_version))
+            raise error_type(error)
+        return event
+
+    def __update_requirements(self, event_id: ObjectId, update: Union[Dict, List[Dict]], **kwargs) -> EventRequirements:
+        event = self.__update_event(event_id, update, projection={'requirements': 1, 'version': 1}, **kwargs)
+        return self.__from_dict(EventRequirements, event)
+
+    def list_events(self, venue_id: Optional[ObjectId] = None, from_date: Optional[datetime] = None,
+                    to_date: Optional[datetime] = None) -> List[EventSummary]:
+        """
+        List events by show date, optionally only the ones of a venue or in [from_date, to_date[, without their
+        requirements, solution and history
+        """
+        query = {}
+        if venue_id is not None:
+            query['venue_id'] = venue_id
+        if from_date is not None or to_date is not None:
+            query['show_date'] = {}
+            if from_date is not None:
+                query['show_date']['$gte'] = from_date
+            if to_date is not None:
+                query['show_date']['$lt'] = to_date
+        items = self.events.find(query, {'name': 1, 'show_date': 1, 'venue_id': 1}).sort('show_date', DESCENDING)
+        return [EventSummary(**item) for item in items]
 
     def get_venue(self, venue_id: ObjectId) -> Venue:
         """
-        Get a venue by Id
+        Get a venue by Id.
+        Venues are cached, the returned object must not be modified.
         """
-        venue = self.venues.find_one({'_id': venue_id})
-        if venue is None:
+        venue = self.venue_cache.get(venue_id)
+        if venue is not None:
+            return venue
+        document = self.venues.find_one({'_id': venue_id})
+        if document is None:
             raise NotFoundException("No venue with id={}".format({venue_id}))
-        return dacite.from_dict(data_class=Venue, data=venue, config=dacite.Config(cast=[Enum]))
+        # venues imported without seat values get them computed here
+        venue = analysis.analyze_venue(self.__from_dict(Venue, encoding.expand_venue(document)))
+        self.venue_cache.put(venue_id, venue)
+        return venue
 
     def create_event(self,
                      name: str,
@@ -89,84 +197,249 @@ class MainService:
         event._id = result.inserted_id
         return event
 
+    def create_events(self, events: List[Tuple[str, datetime, ObjectId]]) -> List[Event]:
+        """
+        Create many events from scratch at once, from their name, show_date and venue_id.
+        Nothing is created if one of the venues does not exist.
+        """
+        venue_ids = {venue_id for _, _, venue_id in events}
+        existing_ids = {venue['_id'] for venue in self.venues.find({'_id': {'$in': list(venue_ids)}}, {'_id': 1})}
+        if venue_ids != existing_ids:
+            raise NotFoundException("No venue with id={}".format(venue_ids - existing_ids))
+        res = [Event(name=name, show_date=show_date, venue_id=venue_id,
+                     requirements=Requirements(), solution=None, history=History())
+               for name, show_date, venue_id in events]
+        ids = self.database_manager.insert_many(self.events, [self.__trim_id(asdict(event)) for event in res])
+        for event, event_id in zip(res, ids):
+            event._id = event_id
+        return res
+
     def get_event(self, event_id: ObjectId) -> Event:
         """
-        Get an event by Id
+        Get an event by Id.
+        Events are cached until their version changes, the returned object must not be modified.
         """
-        event = self.events.find_one({'_id': event_id})
-        if event is None:
-            raise NotFoundException("No event with id={}".format({event_id}))
-        return dacite.from_dict(data_class=Event, data=event, config=dacite.Config(cast=[Enum]))
+        event = self.event_cache.get(event_id)
+        if event is not None and event.version == self.get_event_version(event_id):
+            return event
+        event = self.__from_dict(Event, encoding.expand_event(self.__find_event(event_id)))
+        self.event_cache.put(event_id, event)
+        return event
 
-    def add_group(self, event_id: ObjectId, name: str, size: int, accessibility: bool) -> Event:
+    def get_event_version(self, event_id: ObjectId) -> int:
+        """
+        Get the version of an event, which is incremented by every update
+        """
+        return self.__find_event(event_id, {'version': 1}).get('version', 0)
+
+    def add_group(self, event_id: ObjectId, name: str, size: int, accessibility: bool,
+                  expected_version: Optional[int] = None) -> EventRequirements:
         """
         Add a new group but do not invalidate the current solution.
+        Its group_n is assigned by the database, so that concurrent adds can't get the same one.
         """
-        event = self.get_event(event_id)
-        group = Group(name=name, size=size, accessibility=accessibility, group_n=len(event.requirements.group_queue))
-        event.requirements.group_queue.append(group)
-        self.events.update_one({"_id": event_id}, {"$push": {'requirements.group_queue': asdict(group)}})
-        return event
+        group = Group(name=name, size=size, accessibility=accessibility, group_n=None)
+        return self.add_groups(event_id, [group], expected_version=expected_version)
 
-    def update_group(self, event_id: ObjectId, group: Group):
+    def add_groups(self, event_id: ObjectId, groups: List[Group],
+                   expected_version: Optional[int] = None) -> EventRequirements:
+        """
+        Append groups to the queue in a single update, they get contiguous group_n in the given order.
+        The current solution is not invalidated.
+        """
+        group_queue = {'$ifNull': ['$requirements.group_queue', []]}
+        return self.__update_requirements(event_id, [{'$set': {'requirements.group_queue': {'$concatArrays': [
+            group_queue,
+            [
+                # $literal keeps names starting with a $ from being read as field paths
+                {'$mergeObjects': [{'$literal': asdict(replace(group, group_n=None))},
+                                   {'group_n': {'$add': [{'$size': group_queue}, i]}}]}
+                for i, group in enumerate(groups)
+            ]
+        ]}}}], expected_version=expected_version)
+
+    def update_group(self, event_id: ObjectId, group: Group,
+                     expected_version: Optional[int] = None) -> EventRequirements:
         """
         Update a group, invalidate the current solution if any.
         """
-
-        event = self.get_event(event_id)
         if group.group_n is None:
             raise TragosException("can't update a group with no group_n")
-        if not (0 <= group.group_n < len(event.requirements.group_queue)):
+        if group.group_n < 0:
             raise TragosException("can't update a group which does not exist")
-        event.requirements.group_queue[group.group_n] = group
-        event.solution = None
-        self.events.update_one({"_id": event_id}, {
-            "$set": {
-                'requirements.group_queue.' + str(group.group_n): asdict(group),
-                'solution': None
-            }
-        })
-        return event
+        path = 'requirements.group_queue.' + str(group.group_n)
+        return self.__update_requirements(event_id, {"$set": {path: asdict(group)}},
+                                          conditions={path: {'$exists': True}}, expected_version=expected_version,
+                                          invalidate_solution=True, error="can't update a group which does not exist")
 
-    def delete_group(self, event_id: ObjectId, group_n: int):
+    def delete_group(self, event_id: ObjectId, group_n: int,
+                     expected_version: Optional[int] = None) -> EventRequirements:
+        """
+        Delete a group from the group queue, the following groups are renumbered.
+        Invalidate the current solution if any.
+        """
+        return self.__update_requirements(event_id, [{'$set': {'requirements.group_queue': {'$map': {
+            'input': {'$filter': {
+                'input': '$requirements.group_queue', 'as': 'group', 'cond': {'$ne': ['$$group.group_n', group_n]}
+            }},
+            'as': 'group',
+            'in': {'$mergeObjects': ['$$group', {'group_n': {'$cond': [
+                {'$lt': ['$$group.group_n', group_n]}, '$$group.group_n', {'$subtract': ['$$group.group_n', 1]}
+            ]}}]}
+        }}}}], conditions={'requirements.group_queue.group_n': group_n}, expected_version=expected_version,
+            invalidate_solution=True, error="can't delete a group which does not exist")
+
+    def compute_solution(self, event_id: ObjectId,
+                         progress_callback: Optional[Callable[[ComputeProgress], None]] = None) -> Solution:
         """
-        Delete a group from the group queue, invalidate the current solution if any.
+        Compute a solution based on actual requirement and venue, overriding previous solution if any.
+        Raise ConflictException if the requirements were changed during the computation, groups added at the end of
+        the queue being the only changes allowed.
         """
+        solution, _ = self.compute_solution_with_stats(event_id, progress_callback=progress_callback)
+        return solution
 
-        event = self.get_event(event_id)
-        if not (0 <= group_n < len(event.requirements.group_queue)):
-            raise TragosException("can't delete a group which does not exist")
+    def compute_solution_with_stats(self, event_id: ObjectId,
+                                    progress_callback: Optional[Callable[[ComputeProgress], None]] = None
+                                    ) -> Tuple[Solution, engine.SearchStats]:
+        """
+        Same as compute_solution, also returning where the search time went
+        """
+        event = self.__find_event(event_id, {'venue_id': 1, 'requirements': 1, 'requirements_version': 1})
+        requirements = self.__from_dict(Requirements, event['requirements'])
+        venue = self.get_venue(event['venue_id'])
+        if Config.PORTFOLIO_WORKERS > 1:
+            # no progress is reported by the parallel searches
+            solution, stats = portfolio.start_portfolio_with_stats(venue=venue, requirements=requirements,
+                                                                   max_workers=Config.PORTFOLIO_WORKERS, max_loop=500,
+                                                                   meta_state_cache=self.meta_state_cache,
+                                                                   time_budget=Config.COMPUTE_TIME_BUDGET,
+                                                                   max_fringe_size=Config.MAX_FRINGE_SIZE or None,
+                                                                   beam_width=Config.BEAM_WIDTH or None)
+        else:
+            solution, stats = engine.start_with_stats(venue=venue, requirements=requirements, max_expand=100,
+                                                      max_loop=500, meta_state_cache=self.meta_state_cache,
+                                                      time_budget=Config.COMPUTE_TIME_BUDGET,
+                                                      progress_callback=progress_callback,
+                                                      max_fringe_size=Config.MAX_FRINGE_SIZE or None,
+                                                      beam_width=Config.BEAM_WIDTH or None)
+        self.__store_solution(event_id, solution, event.get('requirements_version', 0))
+        return solution, stats
+
+    def __store_solution(self, event_id: ObjectId, solution: Solution, requirements_version: int):
+        self.__update_event(event_id, {"$set": {'solution': encoding.compact_solution(asdict(solution))}},
+                            conditions={'requirements_version': _version_filter(requirements_version)},
+                            projection={'_id': 1}, error_type=ConflictException,
+                            error="the groups of event {} changed during the computation".format(event_id))
+
+    def place_new_groups(self, event_id: ObjectId) -> Optional[Solution]:
+        """
+        Place the groups added since the current solution was computed, keeping already placed groups in their slots.
+        Return None if there is no current solution or if a new group can't be placed this way: a full computation is
+        then needed, see create_compute_job.
+        """
+        event = self.__find_event(event_id, {'venue_id': 1, 'requirements': 1, 'solution': 1,
+                                             'requirements_version': 1})
+        if event.get('solution') is None:
+            return None
+        requirements = self.__from_dict(Requirements, event['requirements'])
+        current_solution = self.__from_dict(Solution, encoding.expand_solution(event['solution']))
+        venue = self.get_venue(event['venue_id'])
+        try:
+            solution = engine.start_incremental(venue=venue, requirements=requirements, solution=current_solution,
+                                                max_expand=100, max_loop=500, meta_state_cache=self.meta_state_cache,
+                                                time_budget=Config.COMPUTE_TIME_BUDGET,
+                                                max_fringe_size=Config.MAX_FRINGE_SIZE or None,
+                                                beam_width=Config.BEAM_WIDTH or None)
+        except ValueError:
+            logging.warning("Current solution of event %s can't be reused", event_id, exc_info=True)
+            return None
+        if solution.num_groups_declined > current_solution.num_groups_declined:
+            return None
+        self.__store_solution(event_id, solution, event.get('requirements_version', 0))
+        return solution
 
-        def update_group_n(group: Group, n: int) -> Group:
-            group.group_n = n
-            return group
+    def export_assignments(self, event_id: ObjectId) -> Iterator[SeatAssignment]:
+        """
+        Iterate over the seats given to each group by the current solution, in group order.
+        Groups that are declined or were added after the solution was computed have no line.
+        The event is read before returning, only the iteration is lazy.
+        """
+        event = self.__find_event(event_id, {'requirements.group_queue': 1,
+                                             'solution.slots': 1, 'solution.assignments': 1})
+        if event.get('solution') is None:
+            raise TragosException("a solution need to be computed before exporting it")
+        groups = event['requirements']['group_queue']
+        slots = event['solution']['slots']
+        assignments = event['solution']['assignments']
+
+        def iterate() -> Iterator[SeatAssignment]:
+            for group, slot_n in zip(groups, assignments):
+                if slot_n is None:
+                    continue
+                for seat in slots[slot_n]['seats']:
+                    yield SeatAssignment(group_n=group['group_n'], group_name=group['name'], group_size=group['size'],
+                                         slot_n=slot_n, row_name=seat['row_name'], col_name=seat['col_name'])
+
+        return iterate()
+
+    def create_compute_job(self, event_id: ObjectId) -> Job:
+        """
+        Register a pending compute job, it must then be submitted to a JobRunner.
+        """
+        # ensure event exists
+        if self.events.count_documents({'_id': event_id}, limit=1) == 0:
+            raise NotFoundException("No event with id={}".format({event_id}))
+        job = Job(event_id=event_id, status=JobStatus.PENDING, created_at=datetime.now())
+        result = self.jobs.insert_one(self.__trim_id(asdict(job)))
+        job._id = result.inserted_id
+        return job
 
-        group_queue = [
-            update_group_n(group, group.group_n if group.group_n < group_n else group.group_n - 1)
-            for group in event.requirements.group_queue
-            if group.group_n != group_n
-        ]
-        event.requirements.group_queue = group_queue
-        event.solution = None
-        self.events.update_one({"_id": event_id}, {
-            "$set": {
-                'requirements.group_queue': [asdict(group) for group in group_queue],
-                'solution': None
-            }
-        })
-        return event
+    def get_job(self, job_id: ObjectId) -> Job:
+        """
+        Get a job by Id
+        """
+        job = self.jobs.find_one({'_id': job_id})
+        if job is None:
+            raise NotFoundException("No job with id={}".format({job_id}))
+        return self.__from_dict(Job, job)
 
-    def compute_solution(self, event_id: ObjectId) -> Solution:
+    def fail_job(self, job_id: ObjectId, error: str):
         """
-        Compute a solution based on actual requirement and venue, overriding previous solution if any
+        Mark a job as failed unless it already finished, for failures it could not store itself
         """
-        event = self.get_event(event_id)
-        venue = self.get_venue(event.venue_id)
-        solution = engine.start(venue=venue, requirements=event.requirements, max_expand=100, max_loop=500)
-        self.events.update_one({"_id": event_id}, {"$set": {'solution': asdict(solution)}})
-        return solution
+        self.jobs.update_one({'_id': job_id, 'status': {'$in': [JobStatus.PENDING, JobStatus.RUNNING]}},
+                             {'$set': {'status': JobStatus.FAILED, 'error': error}})
 
-    def unlock_accessible_seats(self, event_id: ObjectId) -> Event:
+    def run_compute_job(self, job_id: ObjectId, progress_interval: float = 0.5):
+        """
+        Compute the solution of a job, storing its status and progress along the way.
+        Meant to be called from a worker process.
+        """
+        job = self.get_job(job_id)
+        self.jobs.update_one({'_id': job_id}, {'$set': {'status': JobStatus.RUNNING}})
+
+        last_update = 0
+        last_progress = ComputeProgress()
+
+        def on_progress(progress: ComputeProgress):
+            nonlocal last_update, last_progress
+            last_progress = progress
+            # do not hammer the database when groups are placed quickly
+            if time.monotonic() - last_update >= progress_interval:
+                last_update = time.monotonic()
+                self.jobs.update_one({'_id': job_id}, {'$set': {'progress': asdict(progress)}})
+
+        try:
+            _, stats = self.compute_solution_with_stats(job.event_id, progress_callback=on_progress)
+        except Exception as e:
+            self.jobs.update_one({'_id': job_id}, {'$set': {'status': JobStatus.FAILED, 'error': str(e)}})
+            raise
+        self.jobs.update_one({'_id': job_id}, {'$set': {'status': JobStatus.DONE, 'progress': asdict(last_progress),
+                                                        'stats': stats.summary()}})
+
+    def unlock_accessible_seats(self, event_id: ObjectId,
+                                expected_version: Optional[int] = None) -> EventRequirements:
         """
         Permit everyone to use accessible seats.
         A solution must be computed before calling this method.
@@ -175,40 +448,36 @@ class MainService:
         If the user recomputes, remaining accessible seats will be available to other groups.
         """
 
-        event = self.get_event(event_id)
-
-        if event.solution is None:
-            raise TragosException("a solution need to be computed before unlocking accessible seats")
-
-        event.requirements.lock_accessibility = False
-        for group in event.requirements.group_queue:
-            if group.accessibility and group.slot is None:
-                slot_n = event.solution.assignments[group.group_n]
-                if slot_n is not None:
-                    group.accessible_locked = True
-
-        self.events.update_one({"_id": event_id}, {"$set": {
-            'requirements': asdict(event.requirements),
-            'solution': asdict(event.solution)
-        }})
-        return event
-
-    def lock_accessible_seats(self, event_id: ObjectId) -> Event:
+        # groups added after the solution was computed have no assignment
+        slot_n = {'$ifNull': [{'$arrayElemAt': ['$solution.assignments', '$$group.group_n']}, None]}
+        placed = {'$and': ['$$group.accessibility',
+                           {'$eq': [{'$ifNull': ['$$group.slot', None]}, None]},
+                           {'$ne': [slot_n, None]}]}
+        return self.__update_requirements(event_id, [{'$set': {
+            'requirements.lock_accessibility': False,
+            'requirements.group_queue': {'$map': {
+                'input': '$requirements.group_queue', 'as': 'group',
+                'in': {'$mergeObjects': ['$$group', {
+                    'accessible_locked': {'$cond': [placed, True, '$$group.accessible_locked']}
+                }]}
+            }}
+        }}], conditions={'solution': {'$ne': None}}, expected_version=expected_version,
+            error="a solution need to be computed before unlocking accessible seats")
+
+    def lock_accessible_seats(self, event_id: ObjectId,
+                              expected_version: Optional[int] = None) -> EventRequirements:
         """
         Only assign "accessible" groups to accessible slots.
         Assigned accessible seats will remains locked however.
         The current solution is invalidated. The user need to recompute after re-locking this.
         """
 
-        event = self.get_event(event_id)
-        event.requirements.lock_accessibility = True
-        for group in event.requirements.group_queue:
-            if group.accessibility:
-                group.accessible_locked = False
-        event.solution = None
-        self.events.update_one({"_id": event_id}, {"$set": {
-            'requirements': asdict(event.requirements),
-            'solution': None
-        }})
-        return event
-
+        return self.__update_requirements(event_id, [{'$set': {
+            'requirements.lock_accessibility': True,
+            'requirements.group_queue': {'$map': {
+                'input': '$requirements.group_queue', 'as': 'group',
+                'in': {'$mergeObjects': ['$$group', {
+                    'accessible_locked': {'$cond': ['$$group.accessibility', False, '$$group.accessible_locked']}
+                }]}
+            }}
+        }}], expected_version=expected_version, invalidate_solution=True)
@@ -0,0 +1,48 @@
+from collections import defaultdict
+from math import floor, sqrt
+from typing import Dict, List, Tuple
+
+from tragos.models import Seat, Venue
+
+
+class SpatialIndex:
+    """
+    Answer "which seats are close to this point" without scanning the whole venue.
+    """
+
+    def within(self, x: float, y: float, radius: float) -> List[Seat]:
+        """
+        Return all seats whose distance to (x, y) is strictly lower than radius
+        """
+        raise NotImplementedError
+
+
+class GridSpatialIndex(SpatialIndex):
+    """
+    Uniform grid hashing: seats are bucketed into square cells of side cell_size, so a radius query only has to look
+    at the cells overlapping the query circle. With cell_size close to the query radius, a query visits 9 cells.
+    """
+
+    def __init__(self, venue: Venue, cell_size: float):
+        assert cell_size > 0
+        self._cell_size = cell_size
+        self._cells: Dict[Tuple[int, int], List[Seat]] = defaultdict(list)
+        for row in venue.rows:
+            for seat in row.seats:
+                self._cells[self.__cell(seat.x, seat.y)].append(seat)
+
+    def __cell(self, x: float, y: float) -> Tuple[int, int]:
+        return floor(x / self._cell_size), floor(y / self._cell_size)
+
+    def within(self, x: float, y: float, radius: float) -> List[Seat]:
+        if radius <= 0:
+            return []
+        min_cx, min_cy = self.__cell(x - radius, y - radius)
+        max_cx, max_cy = self.__cell(x + radius, y + radius)
+        res = []
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                for seat in self._cells.get((cx, cy), ()):
+                    if sqrt((x - seat.x) ** 2 + (y - seat.y) ** 2) < radius:
+                        res.append(seat)
+        return res